@@ -0,0 +1,49 @@
+import click
+import json
+import time
+
+from fixtures import stop_event_response
+from reference import stop_event_records
+
+from ticktrack.parser import parse_stop_event_response
+from ticktrack.response import xml2trias_response
+
+@click.command()
+@click.option('--results', default=20, help='Number of StopEventResults per response')
+@click.option('--calls', default=20, help='Number of calls per StopEventResult')
+@click.option('--responses', default=50, help='Number of different responses')
+@click.option('--iterations', default=10, help='Number of iterations over all responses')
+def main(results, calls, responses, iterations):
+    payloads = [stop_event_response(f"de:08231:{n}", results, calls, seed=n) for n in range(responses)]
+
+    # both parsers must produce exactly the same records
+    for payload in payloads:
+        if parse_stop_event_response(payload) != stop_event_records(xml2trias_response(payload)):
+            raise click.ClickException('Parser and objectify reference implementation produce different records')
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for payload in payloads:
+            stop_event_records(xml2trias_response(payload))
+
+    objectify_duration = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for payload in payloads:
+            parse_stop_event_response(payload)
+
+    parser_duration = time.perf_counter() - start
+
+    num_responses = responses * iterations
+    print(json.dumps({
+        'results': results,
+        'calls': calls,
+        'responses': num_responses,
+        'objectify_ms_per_response': round(objectify_duration / num_responses * 1000, 3),
+        'parser_ms_per_response': round(parser_duration / num_responses * 1000, 3),
+        'speedup': round(objectify_duration / parser_duration, 2)
+    }, indent=4))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+import click
+import json
+import time
+
+from ticktrack.request import StopEventRequest
+from ticktrack.request import StopEventRequestTemplate
+
+@click.command()
+@click.option('--requests', default=10000, help='Number of requests to build')
+@click.option('--num-results', default=20, help='Number of results per request')
+def main(requests, num_results):
+    template = StopEventRequestTemplate('ticktrack-benchmark', num_results)
+    station_ids = [f"de:08231:{n}" for n in range(100)]
+
+    # the template must produce exactly the same bytes as the objectify request
+    for station_id in station_ids:
+        request = StopEventRequest('ticktrack-benchmark', station_id, '2024-01-01T12:00:00+00:00', num_results)
+        request_timestamp = request.Trias.ServiceRequest.find('{http://www.siri.org.uk/siri}RequestTimestamp').text
+
+        if request.xml() != template.render(station_id, '2024-01-01T12:00:00+00:00', request_timestamp):
+            raise click.ClickException('Request template and StopEventRequest produce different XML')
+
+    start = time.perf_counter()
+    for n in range(requests):
+        StopEventRequest('ticktrack-benchmark', station_ids[n % len(station_ids)], '2024-01-01T12:00:00+00:00', num_results).xml()
+
+    objectify_duration = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for n in range(requests):
+        template.render(station_ids[n % len(station_ids)], '2024-01-01T12:00:00+00:00')
+
+    template_duration = time.perf_counter() - start
+
+    print(json.dumps({
+        'requests': requests,
+        'objectify_us_per_request': round(objectify_duration / requests * 1000000, 2),
+        'template_us_per_request': round(template_duration / requests * 1000000, 2),
+        'speedup': round(objectify_duration / template_duration, 2)
+    }, indent=4))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import click
+import datetime
+import json
+import logging
+import os
+import platform
+import tempfile
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from sqlobject import connectionForURI
+from sqlobject import sqlhub
+
+from fixtures import stop_event_response
+from stubserver import StubTriasServer
+
+from ticktrack.client import TriasClient
+from ticktrack.observer import Observer
+from ticktrack.parser import parse_stop_event_response
+from ticktrack.request import StopEventRequestTemplate
+from ticktrack.scheduler import StationScheduler
+from ticktrack.schema import Schema
+from ticktrack.store import TripStore
+from ticktrack.worker import MonitorWorker
+
+@click.command()
+@click.option('--stations', default=100, help='Number of stations')
+@click.option('--results', default=20, help='Number of StopEventResults per response')
+@click.option('--calls', default=20, help='Number of calls per StopEventResult')
+@click.option('--latency', default=0.05, help='Latency in seconds of the stub server')
+@click.option('--concurrency', default=8, help='Max. number of concurrent requests')
+@click.option('--cycles', default=3, help='Number of observer cycles')
+@click.option('--output', default=None, help='Write results to this JSON file instead of stdout')
+def main(stations, results, calls, latency, concurrency, cycles, output):
+    logging.disable(logging.INFO)
+
+    station_ids = [f"de:08231:{n}" for n in range(stations)]
+    payloads = [stop_event_response(s, results, calls) for s in station_ids]
+
+    benchmarks = dict()
+
+    # building requests
+    template = StopEventRequestTemplate('ticktrack-benchmark', results)
+    benchmarks['request_build'] = _measure(len(station_ids), lambda: [template.render(s, '2024-01-01T12:00:00+00:00') for s in station_ids])
+
+    # parsing responses
+    benchmarks['parse'] = _measure(len(payloads), lambda: [parse_stop_event_response(p) for p in payloads])
+
+    records = [parse_stop_event_response(p) for p in payloads]
+
+    with tempfile.TemporaryDirectory() as directory:
+
+        # writing trips into the database, the first cycle inserts all trips, the following cycles
+        # only update some of them
+        sqlhub.processConnection = connectionForURI(f"sqlite:///{os.path.join(directory, 'write.db3')}")
+        Schema.configure()
+        Schema.upgrade()
+
+        store = TripStore()
+        timestamp = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0).isoformat()
+
+        def write(cycle):
+            for station_id, station_records in zip(station_ids, records):
+                store.observe(station_id, [r._replace(num_added_stops=r.num_added_stops + cycle) for r in station_records], timestamp)
+
+            store.flush()
+
+        benchmarks['db_write_insert'] = _measure(len(station_ids), lambda: write(0))
+        benchmarks['db_write_update'] = _measure(len(station_ids), lambda: write(1))
+
+        # complete observer cycles against the stub server
+        server = StubTriasServer(num_results=results, num_calls=calls, latency=latency)
+        server.start()
+
+        sqlhub.processConnection = connectionForURI(f"sqlite:///{os.path.join(directory, 'cycle.db3')}")
+        Schema.configure()
+        Schema.upgrade()
+
+        client = TriasClient(server.endpoint, pool_size=concurrency)
+        store = TripStore()
+        worker = MonitorWorker(client, 'ticktrack-benchmark', None, store)
+        observer = Observer(worker, client, store, StationScheduler(), None, concurrency)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            durations = list()
+            for _ in range(cycles):
+                start = time.perf_counter()
+                observer.poll(executor, station_ids)
+                durations.append(time.perf_counter() - start)
+
+        server.stop()
+
+        benchmarks['cycle'] = {
+            'operations': len(station_ids) * cycles,
+            'total_s': round(sum(durations), 4),
+            'first_cycle_s': round(durations[0], 4),
+            'avg_cycle_s': round(sum(durations) / len(durations), 4),
+            'per_operation_ms': round(sum(durations) / (len(station_ids) * cycles) * 1000, 4),
+            'operations_per_s': round(len(station_ids) * cycles / sum(durations), 1)
+        }
+
+    result = {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'parameters': {
+            'stations': stations,
+            'results': results,
+            'calls': calls,
+            'latency': latency,
+            'concurrency': concurrency,
+            'cycles': cycles
+        },
+        'benchmarks': benchmarks
+    }
+
+    if output is not None:
+        with open(output, 'w') as output_file:
+            json.dump(result, output_file, indent=4)
+    else:
+        print(json.dumps(result, indent=4))
+
+def _measure(operations: int, function) -> dict:
+    start = time.perf_counter()
+    function()
+    duration = time.perf_counter() - start
+
+    return {
+        'operations': operations,
+        'total_s': round(duration, 4),
+        'per_operation_ms': round(duration / operations * 1000, 4),
+        'operations_per_s': round(operations / duration, 1)
+    }
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import datetime
+import random
+
+def stop_event_response(station_id: str, num_results: int = 20, num_calls: int = 20, now: datetime.datetime|None = None, seed: int = 0) -> bytes:
+    # generates a synthetic StopEventResponse with realtime data, cancelled trips and
+    # cancelled or added stops similar to the responses of a real TRIAS endpoint
+    rand = random.Random(f"{station_id}-{seed}")
+
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+    now = now.replace(microsecond=0)
+    operation_day = now.date().isoformat()
+
+    xml = list()
+    xml.append('<?xml version="1.0" encoding="UTF-8"?>')
+    xml.append('<Trias xmlns="http://www.vdv.de/trias" xmlns:siri="http://www.siri.org.uk/siri" version="1.1">')
+    xml.append(f"<ServiceDelivery><siri:ResponseTimestamp>{_timestamp(now)}</siri:ResponseTimestamp><siri:ProducerRef>ticktrack-benchmark</siri:ProducerRef><siri:Status>true</siri:Status>")
+    xml.append('<DeliveryPayload><StopEventResponse>')
+
+    for n in range(num_results):
+        departure = now + datetime.timedelta(minutes=2 * n + 1)
+        realtime = rand.random() < 0.6
+        line_id = f"de:vpe:{rand.choice(['04720', '04721', '01000'])}:"
+        trip_id = f"{station_id}-{n}-{rand.randint(0, 3)}"
+
+        num_previous_calls = rand.randint(0, num_calls // 2)
+        num_onward_calls = num_calls - num_previous_calls
+
+        xml.append(f"<StopEventResult><ResultId>ID{n}</ResultId><StopEvent>")
+
+        for c in range(num_previous_calls):
+            xml.append(_call('PreviousCall', c + 1, f"{station_id}-p{c}", departure + datetime.timedelta(minutes=3 * (c - num_previous_calls)), realtime, rand, arrival=c > 0))
+        
+        xml.append(_call('ThisCall', num_previous_calls + 1, station_id, departure, realtime, rand))
+
+        for c in range(num_onward_calls):
+            xml.append(_call('OnwardCall', num_previous_calls + c + 2, f"{station_id}-o{c}", departure + datetime.timedelta(minutes=3 * (c + 1)), realtime, rand, departure=c < num_onward_calls - 1))
+
+        xml.append(f"<Service><OperatingDayRef>{operation_day}</OperatingDayRef><JourneyRef>{trip_id}</JourneyRef><LineRef>{line_id}</LineRef>")
+        xml.append(f"<DirectionRef>outward</DirectionRef><Mode><PtMode>bus</PtMode></Mode><PublishedLineName><Text>{line_id[-6:-1]}</Text></PublishedLineName>")
+        xml.append(f"<OriginStopPointRef>{station_id}-p0</OriginStopPointRef><OriginText><Text>Origin</Text></OriginText>")
+        xml.append(f"<DestinationStopPointRef>{station_id}-o{num_onward_calls - 1}</DestinationStopPointRef><DestinationText><Text>Destination</Text></DestinationText>")
+
+        if rand.random() < 0.05:
+            xml.append('<Cancelled>true</Cancelled>')
+
+        xml.append('</Service></StopEvent></StopEventResult>')
+
+    xml.append('</StopEventResponse></DeliveryPayload></ServiceDelivery></Trias>')
+
+    return ''.join(xml).encode('utf-8')
+
+def _call(name: str, sequence: int, stop_id: str, timetabled: datetime.datetime, realtime: bool, rand: random.Random, arrival: bool = True, departure: bool = True) -> str:
+    estimated = timetabled + datetime.timedelta(minutes=rand.randint(0, 3))
+
+    xml = f"<{name}><CallAtStop><StopPointRef>{stop_id}</StopPointRef><StopPointName><Text>{stop_id}</Text></StopPointName>"
+
+    if arrival:
+        xml += f"<ServiceArrival><TimetabledTime>{_timestamp(timetabled)}</TimetabledTime>"
+        xml += f"<EstimatedTime>{_timestamp(estimated)}</EstimatedTime>" if realtime else ''
+        xml += '</ServiceArrival>'
+
+    if departure:
+        xml += f"<ServiceDeparture><TimetabledTime>{_timestamp(timetabled)}</TimetabledTime>"
+        xml += f"<EstimatedTime>{_timestamp(estimated)}</EstimatedTime>" if realtime else ''
+        xml += '</ServiceDeparture>'
+
+    xml += f"<StopSeqNumber>{sequence}</StopSeqNumber>"
+
+    if rand.random() < 0.03:
+        xml += '<NotServicedStop>true</NotServicedStop>'
+
+    if rand.random() < 0.02:
+        xml += '<UnplannedStop>true</UnplannedStop>'
+
+    xml += f"</CallAtStop></{name}>"
+
+    return xml
+
+def _timestamp(timestamp: datetime.datetime) -> str:
+    return timestamp.astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
@@ -0,0 +1,83 @@
+from typing import List
+
+from ticktrack.parser import StopEventRecord
+from ticktrack.parser import _iso
+from ticktrack.response import TriasResponse
+from ticktrack.triasxml import exists as triasxml_exists
+from ticktrack.triasxml import get_value as triasxml_get_value
+
+def stop_event_records(response: TriasResponse|None) -> List[StopEventRecord]:
+    # reference implementation based on the objectify tree, the streaming parser
+    # must produce exactly the same records
+    records = list()
+
+    if triasxml_exists(response, 'Trias.ServiceDelivery.DeliveryPayload.StopEventResponse.StopEventResult'):
+        for stop_event_result in response.Trias.ServiceDelivery.DeliveryPayload.StopEventResponse.StopEventResult:
+            if not triasxml_exists(stop_event_result, 'StopEvent'):
+                continue
+
+            if triasxml_exists(stop_event_result, 'StopEvent.PreviousCall'):
+                first_call = stop_event_result.StopEvent.PreviousCall[0]
+                start_time = _iso(triasxml_get_value(first_call, 'CallAtStop.ServiceDeparture.TimetabledTime'))
+            elif triasxml_exists(stop_event_result, 'StopEvent.ThisCall'):
+                start_time = _iso(triasxml_get_value(stop_event_result.StopEvent.ThisCall, 'CallAtStop.ServiceDeparture.TimetabledTime'))
+            else:
+                start_time = ""
+
+            if triasxml_exists(stop_event_result, 'StopEvent.OnwardCall'):
+                last_call = stop_event_result.StopEvent.OnwardCall[-1]
+                end_time = _iso(triasxml_get_value(last_call, 'CallAtStop.ServiceArrival.TimetabledTime'))
+            elif triasxml_exists(stop_event_result, 'StopEvent.ThisCall'):
+                end_time = start_time
+            else:
+                end_time = ""
+
+            departure_time = None
+            if triasxml_exists(stop_event_result, 'StopEvent.ThisCall'):
+                this_call = stop_event_result.StopEvent.ThisCall
+                if triasxml_exists(this_call, 'CallAtStop.ServiceDeparture'):
+                    departure_time = _iso(triasxml_get_value(this_call, 'CallAtStop.ServiceDeparture.TimetabledTime'))
+                elif triasxml_exists(this_call, 'CallAtStop.ServiceArrival'):
+                    departure_time = _iso(triasxml_get_value(this_call, 'CallAtStop.ServiceArrival.TimetabledTime'))
+
+            cancelled = 0
+            num_cancelled_stops = 0
+            num_added_stops = 0
+
+            if triasxml_exists(stop_event_result, 'StopEvent.Service.Cancelled') and stop_event_result.StopEvent.Service.Cancelled:
+                cancelled = 1
+
+            calls = list()
+            if triasxml_exists(stop_event_result, 'StopEvent.PreviousCall'):
+                calls.extend(stop_event_result.StopEvent.PreviousCall)
+            if triasxml_exists(stop_event_result, 'StopEvent.ThisCall'):
+                calls.append(stop_event_result.StopEvent.ThisCall)
+            if triasxml_exists(stop_event_result, 'StopEvent.OnwardCall'):
+                calls.extend(stop_event_result.StopEvent.OnwardCall)
+
+            for call in calls:
+                if triasxml_exists(call, 'CallAtStop.NotServicedStop') and call.CallAtStop.NotServicedStop:
+                    num_cancelled_stops = num_cancelled_stops + 1
+
+                if triasxml_exists(call, 'CallAtStop.UnplannedStop') and call.CallAtStop.UnplannedStop:
+                    num_added_stops = num_added_stops + 1
+
+            records.append(StopEventRecord(
+                operation_day=triasxml_get_value(stop_event_result, 'StopEvent.Service.OperatingDayRef'),
+                trip_id=triasxml_get_value(stop_event_result, 'StopEvent.Service.JourneyRef'),
+                line_id=triasxml_get_value(stop_event_result, 'StopEvent.Service.LineRef'),
+                line_name=triasxml_get_value(stop_event_result, 'StopEvent.Service.PublishedLineName.Text'),
+                origin_stop_id=triasxml_get_value(stop_event_result, 'StopEvent.Service.OriginStopPointRef'),
+                origin_name=triasxml_get_value(stop_event_result, 'StopEvent.Service.OriginText.Text'),
+                destination_stop_id=triasxml_get_value(stop_event_result, 'StopEvent.Service.DestinationStopPointRef'),
+                destination_name=triasxml_get_value(stop_event_result, 'StopEvent.Service.DestinationText.Text'),
+                start_time=start_time,
+                end_time=end_time,
+                departure_time=departure_time,
+                realtime=triasxml_exists(stop_event_result, 'StopEvent.ThisCall.CallAtStop.ServiceDeparture.EstimatedTime'),
+                cancelled=cancelled,
+                num_cancelled_stops=num_cancelled_stops,
+                num_added_stops=num_added_stops
+            ))
+
+    return records
@@ -0,0 +1,107 @@
+import click
+import gzip
+import re
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from fixtures import stop_event_response
+
+_STOP_POINT_REF = re.compile(rb'<StopPointRef>([^<]*)</StopPointRef>')
+_NUMBER_OF_RESULTS = re.compile(rb'<NumberOfResults>([0-9]+)</NumberOfResults>')
+
+class StubTriasServer:
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, num_results: int|None = None, num_calls: int = 20, latency: float = 0.0) -> None:
+        self._num_results = num_results
+        self._num_calls = num_calls
+        self._latency = latency
+
+        # responses are generated once per station and number of results,
+        # so the server itself doesn't become the bottleneck
+        self._responses = dict()
+        self._lock = threading.Lock()
+
+        self.num_requests = 0
+
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self._server.server_address[0:2]
+        return f"http://{host}:{port}/trias"
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def response(self, request: bytes) -> bytes:
+        station_id = _STOP_POINT_REF.search(request).group(1).decode('utf-8')
+
+        if self._num_results is not None:
+            num_results = self._num_results
+        else:
+            match = _NUMBER_OF_RESULTS.search(request)
+            num_results = int(match.group(1)) if match is not None else 20
+
+        key = (station_id, num_results)
+        with self._lock:
+            self.num_requests = self.num_requests + 1
+
+            if key not in self._responses:
+                self._responses[key] = stop_event_response(station_id, num_results, self._num_calls)
+
+            return self._responses[key]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                request = self.rfile.read(int(self.headers['Content-Length']))
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    request = gzip.decompress(request)
+
+                if server._latency > 0:
+                    time.sleep(server._latency)
+
+                response = server.response(request)
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/xml')
+                self.send_header('Content-Length', str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+@click.command()
+@click.option('--host', default='127.0.0.1', help='Host to listen on')
+@click.option('--port', default=8080, help='Port to listen on')
+@click.option('--results', default=None, type=int, help='Fixed number of StopEventResults per response, NumberOfResults of the request otherwise')
+@click.option('--calls', default=20, help='Number of calls per StopEventResult')
+@click.option('--latency', default=0.0, help='Latency in seconds added to each response')
+def main(host, port, results, calls, latency):
+    server = StubTriasServer(host, port, results, calls, latency)
+    print(f"Serving synthetic StopEventResponses on {server.endpoint} ...")
+
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
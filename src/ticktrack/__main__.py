@@ -1,19 +1,15 @@
 import click
+import datetime
 import logging
 import os
-import time
-import yaml
 
-from collections import defaultdict
-from datetime import datetime, timedelta, timezone
-from sqlobject import connectionForURI, sqlhub
 from typing import List
 
-from ticktrack.config import Configuration
-from ticktrack.model import MonitoredTrip
-from ticktrack.worker import MonitorWorker
 from ticktrack.version import __version__
 
+# all other modules are imported by the commands which need them, as sqlobject, lxml,
+# requests and yaml take most of the startup time
+
 
 logging.basicConfig(
     level=logging.INFO, 
@@ -29,59 +25,345 @@ def cli():
 def version():
     print(__version__)
 
+@cli.command()
+@click.argument('database')
+@click.option('--compact', is_flag=True, default=False, help='Convert the database into the compact layout')
+def migrate(database, compact):
+    from sqlobject import connectionForURI, sqlhub
+
+    from ticktrack.schema import Schema
+
+    # open existing database and upgrade it in place
+    database = os.path.join(os.getcwd(), database)
+    sqlhub.processConnection = connectionForURI(f"sqlite:///{database}")
+
+    Schema.configure()
+
+    version = Schema.version()
+    if version < Schema.latest_version():
+        version = Schema.upgrade()
+        logging.info(f"Database schema upgraded to version {version}")
+    else:
+        logging.info(f"Database schema is up to date (version {version})")
+
+    if compact:
+        if Schema.compact():
+            logging.info('Database converted into the compact layout')
+        else:
+            logging.info('Database is already in the compact layout')
+
+@cli.command()
+@click.argument('database')
+@click.argument('datalog')
+@click.option('--line', '-l', 'lines', multiple=True, help='Line ID prefix which should be filtered to, can be used multiple times')
+@click.option('--processes', '-p', type=int, default=None, help='Number of processes for parsing responses')
+def replay(database, datalog, lines, processes):
+    from sqlobject import connectionForURI, sqlhub
+
+    from ticktrack.replay import Replay
+    from ticktrack.schema import Schema
+    from ticktrack.store import TripStore
+
+    # open database and upgrade it to the latest schema
+    database = os.path.join(os.getcwd(), database)
+    sqlhub.processConnection = connectionForURI(f"sqlite:///{database}")
+
+    Schema.configure()
+    Schema.upgrade()
+
+    # feed all recorded responses through the trip processing of the worker
+    store: TripStore = TripStore(max_size=1000000)
+    replay: Replay = Replay(store, [l.strip() for l in lines] if len(lines) > 0 else None, processes)
+
+    num_processed = replay.run(datalog)
+    logging.info(f"Replayed {num_processed} responses")
+
+@cli.command()
+@click.argument('database')
+@click.option('--type', '-t', 'report_type', type=click.Choice(['coverage', 'daily', 'cancellations']), default='coverage', help='Type of the report')
+@click.option('--from', 'from_day', default=None, help='First operation day (YYYY-MM-DD) of the report')
+@click.option('--to', 'to_day', default=None, help='Last operation day (YYYY-MM-DD) of the report')
+@click.option('--days', '-d', type=int, default=None, help='Number of past operation days of the report, used instead of --from')
+@click.option('--line', '-l', 'lines', multiple=True, help='Line ID prefix which should be filtered to, can be used multiple times')
+@click.option('--format', '-f', 'output_format', type=click.Choice(['csv', 'json']), default='csv', help='Output format')
+@click.option('--output', '-o', type=click.File('w'), default='-', help='Output file, stdout by default')
+def report(database, report_type, from_day, to_day, days, lines, output_format, output):
+    from sqlobject import connectionForURI, sqlhub
+
+    from ticktrack.report import Report
+    from ticktrack.schema import Schema
+
+    # open database and upgrade it to the latest schema, this creates the summaries of older databases
+    database = os.path.join(os.getcwd(), database)
+    sqlhub.processConnection = connectionForURI(f"sqlite:///{database}")
+
+    Schema.configure()
+    Schema.upgrade()
+
+    if days is not None:
+        from_day = (datetime.date.today() - datetime.timedelta(days=days - 1)).isoformat()
+
+    # reports are generated from the daily summaries per line only
+    report: Report = Report()
+    rows = getattr(report, report_type)(from_day, to_day, [l.strip() for l in lines] if len(lines) > 0 else None)
+
+    Report.write(rows, output, output_format)
+
+@cli.command()
+@click.argument('gtfs')
+@click.option('--line', '--lines', '-l', 'lines', multiple=True, help='Line ID prefix which should be covered, can be used multiple times')
+@click.option('--parent-stations', is_flag=True, default=False, help='Use the parent stations instead of single stops')
+@click.option('--weighted', is_flag=True, default=False, help='Prefer stations with less departures')
+@click.option('--output', '-o', type=click.File('w'), default='-', help='Output file, stdout by default')
+def optimize(gtfs, lines, parent_stations, weighted, output):
+    from ticktrack.optimize import StationOptimizer
+
+    # find a minimal set of stations covering all trips of the lines
+    optimizer: StationOptimizer = StationOptimizer([l.strip() for l in lines] if len(lines) > 0 else None, parent_stations, weighted)
+
+    stations = optimizer.run(gtfs)
+    logging.info(f"Selected {len(stations)} stations covering all trips")
+
+    StationOptimizer.write(stations, output)
+
+@cli.command()
+@click.argument('database')
+@click.argument('shards', nargs=-1, required=True)
+def merge(database, shards):
+    from sqlobject import connectionForURI, sqlhub
+
+    from ticktrack.schema import Schema
+    from ticktrack.shard import ShardMerger
+
+    # open the main database and upgrade it to the latest schema
+    database = os.path.join(os.getcwd(), database)
+    sqlhub.processConnection = connectionForURI(f"sqlite:///{database}")
+
+    Schema.configure()
+    Schema.upgrade()
+
+    # merge all trips of each shard into the main database
+    merger: ShardMerger = ShardMerger()
+    for filename in shards:
+        num_trips, _ = merger.merge(os.path.join(os.getcwd(), filename))
+        logging.info(f"Merged {num_trips} monitored trips of {filename}")
+
+@cli.command()
+@click.argument('database')
+@click.argument('directory')
+@click.option('--keep-days', '-k', type=int, default=7, help='Number of operation days which are kept in the database, min. 2')
+@click.option('--format', '-f', 'archive_format', type=click.Choice(['sqlite', 'csv']), default='sqlite', help='Archive format, one file per month')
+def archive(database, directory, keep_days, archive_format):
+    from sqlobject import connectionForURI, sqlhub
+
+    from ticktrack.archive import Archive
+    from ticktrack.schema import Schema
+
+    # open database and upgrade it to the latest schema
+    database = os.path.join(os.getcwd(), database)
+    sqlhub.processConnection = connectionForURI(f"sqlite:///{database}")
+
+    Schema.configure()
+    Schema.upgrade()
+
+    # move all finished operation days into monthly archives
+    archive: Archive = Archive(directory, keep_days, archive_format)
+
+    num_days, num_trips = archive.run()
+    logging.info(f"Archived {num_trips} monitored trips of {num_days} operation days")
+
 @cli.command()
 @click.argument('database')
 @click.argument('config')
-def observe(database, config):
+@click.option('--shard', default=None, callback=lambda ctx, param, value: _shard(value), help='Observe only the stations of shard i/N and write into a separate database')
+@click.option('--shards', type=int, default=None, help='Start one process per shard and merge their databases periodically')
+@click.option('--once', is_flag=True, default=False, help='Request all stations which are due once and exit, the state of the stations is kept in the database')
+def observe(database, config, shard, shards, once):
+    import yaml
+
+    from sqlobject import connectionForURI, sqlhub
+
+    from ticktrack.archive import Archive
+    from ticktrack.client import TriasClient
+    from ticktrack.config import Configuration
+    from ticktrack.datalog import Datalog
+    from ticktrack.delaylog import DelayLog
+    from ticktrack.metrics import Metrics
+    from ticktrack.metrics import MetricsServer
+    from ticktrack.observer import Observer
+    from ticktrack.scheduler import StationScheduler
+    from ticktrack.schema import Schema
+    from ticktrack.shard import ShardSupervisor
+    from ticktrack.shard import shard_of
+    from ticktrack.shard import shard_path
+    from ticktrack.state import StationState
+    from ticktrack.store import TripStore
+    from ticktrack.window import ResultWindow
+    from ticktrack.worker import MonitorWorker
+
+    if once and shards is not None:
+        raise click.UsageError('--once can not be combined with --shards, use --shard for each shard instead')
+
+    if shard is not None and shards is not None:
+        raise click.UsageError('--shard can not be combined with --shards, which starts all shards itself')
 
     # load config and set default values
-    with open(config, 'r') as config_file:
+    config_filename = config
+    with open(config_filename, 'r') as config_file:
         config = yaml.safe_load(config_file)
 
     config = Configuration.default_config(config)
 
-    # init database tables
     database = os.path.join(os.getcwd(), database)
+
+    # each shard writes into its own database next to the main database
+    if shard is not None:
+        shard_index, num_shards = shard
+        database = shard_path(database, shard_index, num_shards)
+
+    # init database tables
     sqlhub.processConnection = connectionForURI(f"sqlite:///{database}")
 
-    MonitoredTrip.createTable(ifNotExists=True)
+    Schema.configure()
+    Schema.upgrade()
+
+    # finished operation days are moved into archives in order to keep the database small,
+    # shards are not archived but their merged database
+    if config['app']['archive_directory'] is not None and shard is None:
+        archive: Archive|None = Archive(
+            config['app']['archive_directory'],
+            config['app']['retention_days'],
+            config['app']['archive_format']
+        )
+    else:
+        archive: Archive|None = None
+
+    # the supervisor only starts the shards and is the single writer of the main database,
+    # it archives the merged database after each merge
+    if shards is not None and shards > 1:
+        supervisor: ShardSupervisor = ShardSupervisor(database, config_filename, shards, config['app']['merge_interval'], archive)
+        supervisor.run()
+
+        return
 
     # start monitor thread for each station ID
     station_ids: List[str] = [s.strip() for s in config['stations']]
+    if shard is not None:
+        station_ids = [s for s in station_ids if shard_of(s, num_shards) == shard_index]
+
+        logging.info(f"Observing {len(station_ids)} stations of shard {shard_index}/{num_shards}")
+
+    line_ids: List[str]|None = [l.strip() for l in config['lines']] if not len(config['lines']) == 0 else None
+
+    # create one long-lived worker sharing a pooled HTTP client for all stations
+    client: TriasClient = TriasClient(
+        config['app']['endpoint'],
+        config['app']['connect_timeout'],
+        config['app']['read_timeout'],
+        config['app']['request_compression'],
+        config['app']['max_concurrency'],
+        config['app']['max_requests_per_second'],
+        config['app']['max_retries'],
+        config['app']['retry_backoff'],
+        config['app']['circuit_breaker_threshold'],
+        config['app']['circuit_breaker_timeout'],
+        config['app']['adaptive_concurrency']
+    )
+
+    # known trips are cached and all changes of one cycle are written within one transaction,
+    # optionally together with the latest estimated time of each call
+    delay_log: DelayLog|None = DelayLog() if config['app']['delay_log'] else None
+    store: TripStore = TripStore(max_size=config['app']['trip_cache_size'], delay_log=delay_log)
 
-    # create next departure index
-    station_dep_index = defaultdict(lambda: None)
+    # number of results per request is chosen to cover the time until the next request of a station
+    window: ResultWindow = ResultWindow(
+        config['app']['poll_interval'] + config['app']['realtime_lead_time'],
+        config['app']['num_results'],
+        config['app']['min_num_results'],
+        config['app']['max_num_results'],
+        {k.strip(): v for k, v in config['num_results'].items()},
+        config['app']['adaptive_num_results']
+    )
 
-    while True:
+    # timings and counters of all phases, optionally exposed for Prometheus
+    metrics: Metrics = Metrics()
+    if config['app']['metrics_port'] is not None and not once:
+        metrics_port: int = int(config['app']['metrics_port']) + (shard_index - 1 if shard is not None else 0)
+        metrics_server: MetricsServer = MetricsServer(metrics, config['app']['metrics_host'], metrics_port)
+        metrics_server.start()
 
-        logging.info('Performing observer requests ...')
+    # datalog is written in background in order not to block any requests
+    if config['app']['datalog_enabled']:
+        datalog: Datalog|None = Datalog(f"./datalog/shard-{shard_index}-of-{num_shards}" if shard is not None else './datalog')
+        datalog.start()
+    else:
+        datalog: Datalog|None = None
 
+    worker: MonitorWorker = MonitorWorker(
+        client,
+        config['app']['api_key'], 
+        datalog,
+        store,
+        window,
+        metrics,
+        config['app']['incremental'],
+        delay_log=config['app']['delay_log']
+    )
+
+    # create scheduler, all stations are due immediately after starting
+    scheduler: StationScheduler = StationScheduler(
+        config['app']['poll_interval'],
+        config['app']['realtime_lead_time'],
+        config['app']['max_poll_interval']
+    )
+
+    # scheduled runs continue with the state of the last run
+    if once:
+        state: StationState = StationState()
+        num_restored = state.load(station_ids, scheduler, window)
+
+        logging.info(f"Restored the state of {num_restored} stations")
+    else:
         for station_id in station_ids:
+            scheduler.add(station_id)
+
+    observer: Observer = Observer(
+        worker,
+        client,
+        store,
+        scheduler,
+        line_ids,
+        config['app']['max_concurrency'],
+        metrics,
+        config['app']['metrics_log_interval'],
+        archive
+    )
+
+    if once:
+        try:
+            observer.run_once()
+        finally:
+            state.save(station_ids, scheduler, window)
 
-            # check if station preview time is reached
-            next_departure_time = station_dep_index[station_id]
-            if next_departure_time is not None and next_departure_time >= datetime.now(timezone.utc) + timedelta(minutes=5):
-                logging.debug(f"Skipping station {station_id}, preview time window not reached")
-                continue
-            
-            # run worker for this station
-            worker: MonitorWorker = MonitorWorker(
-                database,
-                config['app']['endpoint'], 
-                config['app']['api_key'], 
-                './datalog' if config['app']['datalog_enabled'] else None,
-            )
-
-            if not len(config['lines']) == 0:
-                worker.start(station_id, [l.strip() for l in config['lines']])
-            else:
-                worker.start(station_id, None)
-
-            # store next departure index
-            station_dep_index[station_id] = worker.next_departure_timestamp
-
-        time.sleep(60)
+            if datalog is not None:
+                datalog.close()
+
+            client.close()
+
+        return
+
+    observer.run()
     
+def _shard(value: str|None):
+    if value is None:
+        return None
+
+    from ticktrack.shard import parse_shard
+
+    try:
+        return parse_shard(value)
+    except ValueError as ex:
+        raise click.BadParameter(str(ex))
 
 if __name__ == '__main__':
     cli()
\ No newline at end of file
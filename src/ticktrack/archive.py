@@ -0,0 +1,257 @@
+import csv
+import datetime
+import gzip
+import logging
+import os
+
+from sqlobject import sqlhub
+from typing import List
+from typing import Tuple
+
+from ticktrack.schema import Schema
+
+_COLUMNS = [
+    'id',
+    'operation_day',
+    'trip_id',
+    'line_id',
+    'line_name',
+    'origin_stop_id',
+    'origin_name',
+    'destination_stop_id',
+    'destination_name',
+    'start_time',
+    'end_time',
+    'realtime_ref_station',
+    'realtime_first_appeared',
+    'realtime_cancelled',
+    'realtime_num_cancelled_stops',
+    'realtime_num_added_stops'
+]
+
+_SUMMARY_COLUMNS = [
+    'operation_day',
+    'line_id',
+    'line_name',
+    'num_trips',
+    'num_realtime',
+    'num_cancelled',
+    'num_cancelled_stops',
+    'num_added_stops'
+]
+
+_DELAY_COLUMNS = [
+    'operation_day',
+    'trip_id',
+    'stop_seq',
+    'stop_id',
+    'timetabled_time',
+    'estimated_time',
+    'observed_at'
+]
+
+class Archive:
+
+    def __init__(self, directory: str, retention_days: int = 7, format: str = 'sqlite', connection=None, chunk_size: int = 5000) -> None:
+        self._directory = directory
+        self._format = format
+        self._connection = connection if connection is not None else sqlhub.processConnection
+        self._chunk_size = chunk_size
+
+        # the previous operation day is always kept as its trips may still be running
+        self._retention_days = max(retention_days, 2)
+        self._last_before = None
+
+    def run(self, today: datetime.date|None = None) -> Tuple[int, int]:
+        before = self.boundary(today)
+
+        # nothing to do until the next day has finished
+        if before == self._last_before:
+            return (0, 0)
+
+        num_trips = 0
+
+        operation_days = self.days(before)
+        for operation_day in operation_days:
+            num_trips = num_trips + self.export_day(operation_day)
+
+        self._last_before = before
+
+        return (len(operation_days), num_trips)
+
+    def boundary(self, today: datetime.date|None = None) -> str:
+        # all operation days before the boundary are moved into the archives
+        today = today if today is not None else datetime.date.today()
+
+        return (today - datetime.timedelta(days=self._retention_days - 1)).isoformat()
+
+    def days(self, before: str) -> List[str]:
+        if Schema.is_compact(self._connection):
+            query = "SELECT DISTINCT date(operation_day * 86400, 'unixepoch') FROM trip WHERE operation_day < CAST(strftime('%s', ?) AS INTEGER) / 86400 ORDER BY operation_day"
+        else:
+            query = "SELECT DISTINCT operation_day FROM monitored_trip WHERE operation_day < ? ORDER BY operation_day"
+
+        connection = self._connection.getConnection()
+        try:
+            return [r[0] for r in connection.execute(query, (before,)).fetchall()]
+        finally:
+            self._connection.releaseConnection(connection)
+
+    def export_day(self, operation_day: str) -> int:
+        if not os.path.isdir(self._directory):
+            os.makedirs(self._directory)
+
+        # trips are selected by the index of the underlying table in both layouts
+        if Schema.is_compact(self._connection):
+            condition = "id IN (SELECT id FROM trip WHERE operation_day = CAST(strftime('%s', ?) AS INTEGER) / 86400)"
+            delete = "DELETE FROM trip WHERE operation_day = CAST(strftime('%s', ?) AS INTEGER) / 86400"
+        else:
+            condition = "operation_day = ?"
+            delete = "DELETE FROM monitored_trip WHERE operation_day = ?"
+
+        connection = self._connection.getConnection()
+        try:
+            if self._format == 'csv':
+                num_trips = self._export_csv(connection, operation_day, f"ticktrack-{operation_day[0:7]}.csv.gz", 
+                    f"SELECT {', '.join(_COLUMNS)} FROM monitored_trip WHERE {condition} ORDER BY id", _COLUMNS, ['operation_day', 'trip_id'])
+
+                # delays are written into a separate file if there are any
+                self._export_csv(connection, operation_day, f"ticktrack-{operation_day[0:7]}.call_delay.csv.gz", 
+                    f"SELECT {', '.join(_DELAY_COLUMNS)} FROM call_delay WHERE operation_day = ? ORDER BY trip_id, stop_seq", _DELAY_COLUMNS, ['operation_day', 'trip_id', 'stop_seq'], False)
+            else:
+                num_trips = self._export_sqlite(connection, operation_day, condition)
+
+            # trips are removed from the hot database only after they have been archived,
+            # the daily summaries are kept for reporting
+            connection.execute('BEGIN')
+            connection.execute(delete, (operation_day,))
+            connection.execute('DELETE FROM call_delay WHERE operation_day = ?', (operation_day,))
+            connection.execute('COMMIT')
+        except Exception:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+
+            raise
+        finally:
+            self._connection.releaseConnection(connection)
+
+        logging.info(f"Archived {num_trips} monitored trips of operation day {operation_day}")
+
+        return num_trips
+
+    def _export_sqlite(self, connection, operation_day: str, condition: str) -> int:
+        # one archive database per month with the documented layout, trips are copied
+        # within SQLite and never loaded into memory
+        filename = os.path.join(self._directory, f"ticktrack-{operation_day[0:7]}.db3")
+        connection.execute('ATTACH DATABASE ? AS archive', (filename,))
+        try:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS archive.monitored_trip (" \
+                "id INTEGER PRIMARY KEY, operation_day TEXT, trip_id TEXT, line_id TEXT, line_name TEXT, " \
+                "origin_stop_id TEXT, origin_name TEXT, destination_stop_id TEXT, destination_name TEXT, start_time TEXT, end_time TEXT, " \
+                "realtime_ref_station TEXT, realtime_first_appeared TEXT, realtime_cancelled INT, realtime_num_cancelled_stops INT, realtime_num_added_stops INT)"
+            )
+            connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS archive.monitored_trip_operation_day_trip_id ON monitored_trip (operation_day, trip_id)")
+            connection.execute("CREATE INDEX IF NOT EXISTS archive.monitored_trip_line_id_operation_day ON monitored_trip (line_id, operation_day)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS archive.line_summary (" \
+                "operation_day TEXT NOT NULL, line_id TEXT NOT NULL, line_name TEXT, num_trips INTEGER NOT NULL DEFAULT 0, num_realtime INTEGER NOT NULL DEFAULT 0, " \
+                "num_cancelled INTEGER NOT NULL DEFAULT 0, num_cancelled_stops INTEGER NOT NULL DEFAULT 0, num_added_stops INTEGER NOT NULL DEFAULT 0, " \
+                "PRIMARY KEY (operation_day, line_id)) WITHOUT ROWID"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS archive.call_delay (" \
+                "operation_day TEXT NOT NULL, trip_id TEXT NOT NULL, stop_seq INTEGER NOT NULL, stop_id TEXT, " \
+                "timetabled_time INTEGER NOT NULL, estimated_time INTEGER NOT NULL, observed_at INTEGER NOT NULL, " \
+                "PRIMARY KEY (operation_day, trip_id, stop_seq)) WITHOUT ROWID"
+            )
+
+            # archiving a day again replaces its trips, so an interrupted run can simply be repeated
+            connection.execute('BEGIN')
+            num_trips = connection.execute(
+                f"INSERT OR REPLACE INTO archive.monitored_trip ({', '.join(_COLUMNS)}) SELECT {', '.join(_COLUMNS)} FROM main.monitored_trip WHERE {condition}",
+                (operation_day,)
+            ).rowcount
+            connection.execute(
+                f"INSERT OR REPLACE INTO archive.line_summary ({', '.join(_SUMMARY_COLUMNS)}) SELECT {', '.join(_SUMMARY_COLUMNS)} FROM main.line_summary WHERE operation_day = ?",
+                (operation_day,)
+            )
+            connection.execute(
+                f"INSERT OR REPLACE INTO archive.call_delay ({', '.join(_DELAY_COLUMNS)}) SELECT {', '.join(_DELAY_COLUMNS)} FROM main.call_delay WHERE operation_day = ?",
+                (operation_day,)
+            )
+            connection.execute('COMMIT')
+        except Exception:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+
+            raise
+        finally:
+            connection.execute('DETACH DATABASE archive')
+
+        return num_trips
+
+    def _export_csv(self, connection, operation_day: str, filename: str, query: str, columns: List[str], keys: List[str], empty: bool = True) -> int:
+        # one gzip member is appended per operation day to the file of the month
+        cursor = connection.execute(query, (operation_day,))
+        rows = cursor.fetchmany(self._chunk_size)
+
+        if len(rows) == 0 and not empty:
+            return 0
+
+        filename = os.path.join(self._directory, filename)
+        exists = os.path.exists(filename)
+
+        # archiving a day again replaces its rows, so the file is rewritten without them then
+        if exists and _contains_day(filename, columns.index('operation_day'), operation_day):
+            return self._rewrite_csv(connection, operation_day, filename, query, columns, keys, cursor, rows)
+
+        with gzip.open(filename, 'at', encoding='utf-8', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            if not exists:
+                writer.writerow(columns)
+
+            num_rows = self._write_rows(writer, cursor, rows)
+
+        return num_rows
+
+    def _rewrite_csv(self, connection, operation_day: str, filename: str, query: str, columns: List[str], keys: List[str], cursor, rows: list) -> int:
+        indices = [columns.index(c) for c in keys]
+        replaced = set(_key(r, indices) for r in connection.execute(query, (operation_day,)))
+
+        # the file is replaced only after it has been written completely
+        with gzip.open(filename, 'rt', encoding='utf-8', newline='') as source_file, \
+            gzip.open(f"{filename}.tmp", 'wt', encoding='utf-8', newline='') as csv_file:
+
+            reader = csv.reader(source_file)
+            writer = csv.writer(csv_file)
+
+            writer.writerow(next(reader, columns))
+            writer.writerows(r for r in reader if _key(r, indices) not in replaced)
+
+            num_rows = self._write_rows(writer, cursor, rows)
+
+        os.replace(f"{filename}.tmp", filename)
+
+        return num_rows
+
+    def _write_rows(self, writer, cursor, rows: list) -> int:
+        num_rows = 0
+        while len(rows) > 0:
+            writer.writerows(rows)
+            num_rows = num_rows + len(rows)
+
+            rows = cursor.fetchmany(self._chunk_size)
+
+        return num_rows
+
+def _contains_day(filename: str, index: int, operation_day: str) -> bool:
+    with gzip.open(filename, 'rt', encoding='utf-8', newline='') as csv_file:
+        reader = csv.reader(csv_file)
+        next(reader, None)
+
+        return any(len(r) > index and r[index] == operation_day for r in reader)
+
+def _key(row, indices: List[int]) -> tuple:
+    # values as written by the CSV writer, which writes None as empty string
+    return tuple('' if row[i] is None else str(row[i]) for i in indices)
@@ -0,0 +1,336 @@
+import gzip
+import logging
+import random
+import threading
+import time
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError
+from requests.exceptions import HTTPError
+from requests.exceptions import Timeout
+from urllib3.connection import HTTPConnection
+from urllib3.connection import HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.connectionpool import HTTPSConnectionPool
+
+# responses which indicate a temporary problem of the endpoint, requests are retried for them
+_RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+_THROTTLE_STATUS_CODES = (429, 503)
+
+# handshake durations are collected per thread, as a connection is always
+# established by the thread which is performing the request
+_handshake = threading.local()
+
+class _TimedHTTPConnection(HTTPConnection):
+
+    def connect(self) -> None:
+        start = time.perf_counter()
+        super().connect()
+        _handshake.duration = getattr(_handshake, 'duration', 0.0) + time.perf_counter() - start
+
+class _TimedHTTPSConnection(HTTPSConnection):
+
+    def connect(self) -> None:
+        start = time.perf_counter()
+        super().connect()
+        _handshake.duration = getattr(_handshake, 'duration', 0.0) + time.perf_counter() - start
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+class _TimedHTTPAdapter(HTTPAdapter):
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TimedHTTPConnectionPool,
+            'https': _TimedHTTPSConnectionPool
+        }
+
+class CircuitOpenError(Exception):
+    pass
+
+class _TokenBucket:
+
+    def __init__(self, rate: float) -> None:
+        self._rate = rate
+        self._capacity = max(1.0, rate)
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens = self._tokens - 1
+                    return
+
+                wait = (1 - self._tokens) / self._rate
+
+            time.sleep(wait)
+
+class _CircuitBreaker:
+
+    def __init__(self, threshold: int, reset_timeout: float) -> None:
+        self._threshold = threshold
+        self._reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+
+        self._num_failures = 0
+        self._opened = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened is not None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened is None:
+                return True
+
+            # let one single request pass after the timeout in order to probe the endpoint
+            if not self._probing and time.monotonic() - self._opened >= self._reset_timeout:
+                self._probing = True
+                return True
+
+            return False
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            if success:
+                if self._opened is not None:
+                    logging.info('Endpoint is available again, closing circuit breaker')
+
+                self._num_failures = 0
+                self._opened = None
+                self._probing = False
+            else:
+                self._num_failures = self._num_failures + 1
+                if self._probing or self._num_failures >= self._threshold:
+                    if self._opened is None:
+                        logging.warning(f"Opening circuit breaker after {self._num_failures} failed requests")
+
+                    self._opened = time.monotonic()
+                    self._probing = False
+
+class _ConcurrencyLimiter:
+
+    def __init__(self, max_limit: int, adaptive: bool = True, tolerance: float = 2.0) -> None:
+        self._max_limit = max_limit
+        self._adaptive = adaptive
+        self._tolerance = tolerance
+        self._condition = threading.Condition()
+
+        self._limit = float(max_limit)
+        self._in_flight = 0
+
+        self._avg_latency = None
+        self._baseline_latency = None
+        self._num_samples = 0
+        self._last_decrease = 0.0
+
+    @property
+    def limit(self) -> int:
+        return max(1, int(self._limit))
+
+    def acquire(self) -> None:
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._condition.wait()
+
+            self._in_flight = self._in_flight + 1
+
+    def release(self, latency: float, overloaded: bool) -> None:
+        with self._condition:
+            self._in_flight = self._in_flight - 1
+
+            if self._adaptive:
+                self._update(latency, overloaded)
+
+            self._condition.notify_all()
+
+    def _update(self, latency: float, overloaded: bool) -> None:
+        # the recent latency is compared to the long-term latency of the uncongested endpoint, which is
+        # not affected by the varying size of single responses, the baseline is kept while the endpoint is
+        # congested unless the limit can't be reduced anymore, so permanent changes are followed as well
+        self._avg_latency = latency if self._avg_latency is None else 0.8 * self._avg_latency + 0.2 * latency
+        if self._baseline_latency is None:
+            self._baseline_latency = latency
+
+        congested = overloaded or self._avg_latency > self._tolerance * self._baseline_latency
+        if not congested or self._limit <= 1.0:
+            # plain mean of the first samples, moving average afterwards
+            self._num_samples = self._num_samples + 1
+
+            weight = max(1 / self._num_samples, 0.001)
+            self._baseline_latency = (1 - weight) * self._baseline_latency + weight * latency
+
+        # AIMD, the limit is decreased at most once per latency as all requests in flight
+        # are affected by the same overload, and increased by one per limit requests otherwise
+        now = time.monotonic()
+        if congested:
+            if now - self._last_decrease > self._avg_latency:
+                self._limit = max(1.0, self._limit * (0.5 if overloaded else 0.9))
+                self._last_decrease = now
+        else:
+            self._limit = min(float(self._max_limit), self._limit + 1 / self._limit)
+
+class TriasClient:
+
+    def __init__(self, endpoint: str, connect_timeout: float = 5.0, read_timeout: float = 30.0, compression: bool = False, pool_size: int = 8, 
+                 max_requests_per_second: float|None = None, max_retries: int = 3, retry_backoff: float = 0.5, 
+                 failure_threshold: int = 10, reset_timeout: float = 60.0, adaptive_concurrency: bool = True) -> None:
+        self.endpoint = endpoint
+
+        self._timeout = (connect_timeout, read_timeout)
+        self._compression = compression
+
+        self.headers = {
+            'Content-Type': 'application/xml',
+            'Accept-Encoding': 'gzip, deflate',
+            'User-Agent': 'ticktrack-worker'
+        }
+
+        if self._compression:
+            self.headers['Content-Encoding'] = 'gzip'
+
+        # one session with a connection pool for all requests, connections are kept alive
+        # and re-used as long as the server allows it
+        self._session = Session()
+        self._session.headers.update(self.headers)
+        self._session.mount('http://', _TimedHTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self._session.mount('https://', _TimedHTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+        # requests are limited by rate and by concurrency, which is adjusted to the latency of the endpoint,
+        # the circuit breaker stops all requests for a while if the endpoint keeps failing
+        self._bucket = _TokenBucket(max_requests_per_second) if max_requests_per_second is not None and max_requests_per_second > 0 else None
+        self._limiter = _ConcurrencyLimiter(pool_size, adaptive_concurrency)
+        self._breaker = _CircuitBreaker(failure_threshold, reset_timeout)
+
+        self._max_retries = max_retries
+        self._retry_backoff = retry_backoff
+        self._max_backoff = min(read_timeout, 60.0)
+
+        self._lock = threading.Lock()
+        self._reset_statistics()
+
+    def post(self, data: bytes) -> bytes:
+        if self._compression:
+            data = gzip.compress(data)
+
+        attempt = 0
+        while True:
+            if not self._breaker.allow():
+                raise CircuitOpenError(f"Circuit breaker for {self.endpoint} is open, request skipped")
+
+            if self._bucket is not None:
+                self._bucket.acquire()
+
+            self._limiter.acquire()
+
+            _handshake.duration = 0.0
+
+            overloaded = False
+            retry_after = None
+
+            start = time.perf_counter()
+            try:
+                response = self._session.post(self.endpoint, data=data, timeout=self._timeout)
+
+                if response.status_code in _THROTTLE_STATUS_CODES:
+                    overloaded = True
+                    retry_after = _retry_after(response.headers.get('Retry-After'))
+
+                response.raise_for_status()
+                self._breaker.record(True)
+
+                return response.content
+            except (ConnectionError, Timeout, HTTPError) as ex:
+                retry = not isinstance(ex, HTTPError) or ex.response.status_code in _RETRY_STATUS_CODES
+                overloaded = overloaded or isinstance(ex, Timeout)
+
+                # other HTTP errors are caused by the request, the endpoint itself is available
+                self._breaker.record(not retry)
+
+                if not retry or attempt >= self._max_retries:
+                    raise
+            except BaseException:
+                # any other error counts as failure, otherwise a failed probe would keep the circuit half open
+                self._breaker.record(False)
+                raise
+            finally:
+                latency = time.perf_counter() - start
+
+                self._limiter.release(latency - _handshake.duration, overloaded)
+                self._record(latency, _handshake.duration)
+
+            # exponential backoff with full jitter, unless the server tells when to retry
+            attempt = attempt + 1
+            with self._lock:
+                self._num_retries = self._num_retries + 1
+
+            if retry_after is not None:
+                time.sleep(min(retry_after, self._max_backoff))
+            else:
+                time.sleep(random.uniform(0, min(self._max_backoff, self._retry_backoff * 2 ** attempt)))
+
+    def statistics(self, reset: bool = False) -> dict:
+        with self._lock:
+            statistics = {
+                'requests': self._num_requests,
+                'handshakes': self._num_handshakes,
+                'avg_handshake_ms': self._avg(self._handshake_duration, self._num_handshakes),
+                'avg_latency_new_connection_ms': self._avg(self._latency_new_connection, self._num_handshakes),
+                'avg_latency_reused_connection_ms': self._avg(self._latency_reused_connection, self._num_requests - self._num_handshakes),
+                'retries': self._num_retries,
+                'concurrency_limit': self._limiter.limit,
+                'circuit_open': self._breaker.is_open
+            }
+
+            if reset:
+                self._reset_statistics()
+
+        return statistics
+
+    def close(self) -> None:
+        self._session.close()
+
+    def _record(self, latency: float, handshake: float) -> None:
+        with self._lock:
+            self._num_requests = self._num_requests + 1
+
+            if handshake > 0:
+                self._num_handshakes = self._num_handshakes + 1
+                self._handshake_duration = self._handshake_duration + handshake
+                self._latency_new_connection = self._latency_new_connection + latency
+            else:
+                self._latency_reused_connection = self._latency_reused_connection + latency
+
+    def _reset_statistics(self) -> None:
+        self._num_requests = 0
+        self._num_handshakes = 0
+        self._handshake_duration = 0.0
+        self._latency_new_connection = 0.0
+        self._latency_reused_connection = 0.0
+        self._num_retries = 0
+
+    def _avg(self, total: float, count: int) -> float|None:
+        return round(total / count * 1000, 1) if count > 0 else None
+
+def _retry_after(value: str|None) -> float|None:
+    # only the delay in seconds is supported, HTTP dates are ignored
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
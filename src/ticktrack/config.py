@@ -9,10 +9,38 @@ class Configuration:
             'app': {
                 #'endpoint': 'https://efa.app/trias',
                 #'api_key': 'AwesomeApiKey',
-                'datalog_enabled': False
+                'datalog_enabled': False,
+                'max_concurrency': 8,
+                'connect_timeout': 5,
+                'read_timeout': 30,
+                'request_compression': False,
+                'max_requests_per_second': None,
+                'max_retries': 3,
+                'retry_backoff': 0.5,
+                'circuit_breaker_threshold': 10,
+                'circuit_breaker_timeout': 60,
+                'adaptive_concurrency': True,
+                'trip_cache_size': 100000,
+                'poll_interval': 60,
+                'max_poll_interval': 1800,
+                'realtime_lead_time': 300,
+                'num_results': 20,
+                'min_num_results': 5,
+                'max_num_results': 100,
+                'adaptive_num_results': True,
+                'incremental': False,
+                'delay_log': False,
+                'metrics_host': '127.0.0.1',
+                'metrics_port': None,
+                'metrics_log_interval': 300,
+                'archive_directory': None,
+                'archive_format': 'sqlite',
+                'retention_days': 7,
+                'merge_interval': 300
             },
             'stations': [],
-            'lines': []
+            'lines': [],
+            'num_results': {}
         }
 
         return cls._merge_config(default_config, config)
@@ -22,4 +50,5 @@ class Configuration:
         if isinstance(defaults, dict) and isinstance(actual, dict):
             return {k: cls._merge_config(defaults.get(k, {}), actual.get(k, {})) for k in set(defaults) | set(actual)}
         
-        return actual if actual else defaults
\ No newline at end of file
+        # explicit false or zero values override the defaults, missing or null values don't
+        return actual if actual is not None and actual != {} else defaults
\ No newline at end of file
@@ -1,60 +1,159 @@
+import datetime
+import gzip
 import json
+import logging
 import os
+import queue
+import threading
 
-from datetime import datetime
-from lxml.etree import fromstring
-from lxml.etree import tostring
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+
+class DatalogRecord(NamedTuple):
+    timestamp: str
+    tags: List[str]
+    meta: dict
+    data: bytes
 
 class Datalog:
 
-    @classmethod
-    def cleanup(cls, directory: str, ttl_hours: int = 24) -> None:
-        if not os.path.exists(directory) or not os.path.isdir(directory):
-            os.makedirs(directory)
-
-        # look for old datalog files and remove them
-        # for speed up, check for the filename not beginning with today instead of ressource consuming difference calculation
-        today = datetime.now().strftime('%Y-%m-%d')
-        for datalog_file in os.listdir(directory):
-
-            # proceed only if the datalogfile is not from today
-            if not datalog_file.startswith(today):
-                datalog_timestamp = datalog_file.split('_')[0]
-                datalog_timestamp = datetime.datetime.strptime(datalog_timestamp, '%Y-%m-%d-%H.%M.%S-%f')
-
-                difference = (datetime.datetime.now() - datalog_timestamp).total_seconds()
-                if difference > 60 * 60 * ttl_hours:
-                    datalog_file = os.path.join(directory, datalog_file)
-                    os.remove(datalog_file)
-    @classmethod
-    def create(cls, directory: str, data: str, meta: dict, *args) -> None:
-        cls.cleanup(directory)
-        
-        if not os.path.exists(directory) or not os.path.isdir(directory):
-            os.makedirs(directory)
-
-        # generate new datalog file
-        datalog_timestamp = datetime.now().strftime('%Y-%m-%d-%H.%M.%S-%f')
-        datalog_filename = f"{datalog_timestamp}_{'-'.join([str(a) for a in args])}.xml"
-
-        with open(os.path.join(directory, datalog_filename), 'wb') as datalog_file:
-                try:
-                    xml = tostring(fromstring(data), pretty_print=True)
-                    datalog_file.write(xml)
-                    datalog_file.write(cls._comment(meta))
-                except Exception:
-                    datalog_file.write(data)
-                    datalog_file.write(cls._comment(meta))
-                finally:
-                    datalog_file.close()
+    def __init__(self, directory: str, ttl_hours: int = 24, max_queue_size: int = 1000) -> None:
+        self._directory = directory
+        self._ttl_hours = ttl_hours
+
+        # records are written by a background thread, the request path only enqueues them
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+
+        self._segment = None
+        self._data_file = None
+        self._index_file = None
+
+        self.num_dropped = 0
+
+    def start(self) -> None:
+        if not os.path.exists(self._directory) or not os.path.isdir(self._directory):
+            os.makedirs(self._directory)
+
+        self._thread = threading.Thread(target=self._run, name='ticktrack-datalog', daemon=True)
+        self._thread.start()
+
+    def create(self, data: bytes, meta: dict, *args) -> None:
+        timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+        try:
+            self._queue.put_nowait(DatalogRecord(timestamp, [str(a) for a in args], meta, data))
+        except queue.Full:
+            # never block the request path, records are dropped if the writer can't keep up
+            self.num_dropped = self.num_dropped + 1
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+
+            try:
+                self._write(record)
+
+                # flush only if there's nothing more to write at the moment
+                if self._queue.empty():
+                    self._data_file.flush()
+                    self._index_file.flush()
+            except Exception as ex:
+                logging.error(ex)
+
+        self._close_segment()
+
+    def _write(self, record: DatalogRecord) -> None:
+        # one segment per hour, each record is one gzip member which can be read independently
+        segment = record.timestamp[0:13].replace('T', '-')
+        if segment != self._segment:
+            self._close_segment()
+            self._cleanup()
+
+            if self.num_dropped > 0:
+                logging.warning(f"Dropped {self.num_dropped} datalog records as the writer couldn't keep up")
+                self.num_dropped = 0
+
+            self._segment = segment
+            self._data_file = open(os.path.join(self._directory, f"{segment}.log.gz"), 'ab')
+            self._index_file = open(os.path.join(self._directory, f"{segment}.idx"), 'a', encoding='utf-8')
+
+        data = record.data if isinstance(record.data, bytes) else record.data.encode('utf-8')
+        data = gzip.compress(data, compresslevel=6)
+
+        offset = self._data_file.tell()
+        self._data_file.write(data)
+
+        # the index line is written after the data, so it never references incomplete records
+        self._index_file.write(json.dumps({
+            'offset': offset,
+            'length': len(data),
+            'timestamp': record.timestamp,
+            'tags': record.tags,
+            'meta': record.meta
+        }) + "\n")
+
+    def _close_segment(self) -> None:
+        if self._data_file is not None:
+            self._data_file.close()
+            self._index_file.close()
+
+        self._segment = None
+        self._data_file = None
+        self._index_file = None
+
+    def _cleanup(self) -> None:
+        # remove whole segments which are older than the TTL
+        min_segment = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=self._ttl_hours)).strftime('%Y-%m-%d-%H')
+        for segment in DatalogReader(self._directory).segments():
+            if segment < min_segment:
+                for extension in ('log.gz', 'idx'):
+                    filename = os.path.join(self._directory, f"{segment}.{extension}")
+                    if os.path.exists(filename):
+                        os.remove(filename)
+
+class DatalogReader:
+
+    def __init__(self, directory: str) -> None:
+        self._directory = directory
+
+    def segments(self) -> List[str]:
+        if not os.path.isdir(self._directory):
+            return list()
+
+        return sorted(f[:-len('.idx')] for f in os.listdir(self._directory) if f.endswith('.idx'))
+
+    def index(self, segment: str) -> Iterator[dict]:
+        with open(os.path.join(self._directory, f"{segment}.idx"), 'r', encoding='utf-8') as index_file:
+            for line in index_file:
+                # skip an incomplete last line of a segment which is still written
+                if not line.endswith("\n"):
+                    break
+
+                yield json.loads(line)
+
+    def records(self) -> Iterator[DatalogRecord]:
+        for segment in self.segments():
+            with open(os.path.join(self._directory, f"{segment}.log.gz"), 'rb') as data_file:
+                for index in self.index(segment):
+                    data_file.seek(index['offset'])
+                    data = gzip.decompress(data_file.read(index['length']))
+
+                    yield DatalogRecord(index['timestamp'], index['tags'], index['meta'], data)
 
     @classmethod
-    def _comment(cls, metadata: dict) -> str:
-        comment = "<!--\n"
-        comment += "This message is created by datalog module - See https://gist.github.com/sebastianknopf/677d9ae9f213389e1c3f9aeb0b5e4055\n"
-        comment += "\n"
-        comment += "Request Meta Data:\n"
-        comment += json.dumps(metadata, indent=4) + "\n"
-        comment += "-->"
-
-        return comment.encode('utf-8')
\ No newline at end of file
+    def read(cls, filename: str, offset: int, length: int) -> bytes:
+        with open(filename, 'rb') as data_file:
+            data_file.seek(offset)
+
+            return gzip.decompress(data_file.read(length))
@@ -0,0 +1,65 @@
+import datetime
+
+from collections import OrderedDict
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+from ticktrack.parser import StopEventRecord
+
+class DelayLog:
+
+    def __init__(self, max_size: int = 500000) -> None:
+        self._max_size = max_size
+
+        # calls which need to be written with the next flush and the last estimated time
+        # written per call, both are keyed by (operation_day, trip_id, sequence)
+        self._pending: Dict[Tuple[str, str, int], tuple] = dict()
+        self._written: OrderedDict[Tuple[str, str, int], str] = OrderedDict()
+
+    def observe(self, records: List[StopEventRecord], timestamp: str) -> None:
+        for record in records:
+            if record.calls is None or record.operation_day is None or record.trip_id is None:
+                continue
+
+            # only the latest estimate of a call is kept, unchanged estimates are not written again
+            for call in record.calls:
+                key = (record.operation_day, record.trip_id, call.sequence)
+                if self._written.get(key) == call.estimated_time:
+                    continue
+
+                self._pending[key] = (call.stop_id, call.timetabled_time, call.estimated_time, timestamp)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def write(self, connection) -> int:
+        # runs within the transaction of the caller, pending calls are kept until clear() is called,
+        # times are converted only for the calls which are written
+        connection.executemany(
+            "INSERT INTO call_delay (operation_day, trip_id, stop_seq, stop_id, timetabled_time, estimated_time, observed_at) " \
+            "VALUES (?, ?, ?, ?, ?, ?, ?) " \
+            "ON CONFLICT (operation_day, trip_id, stop_seq) DO UPDATE SET " \
+            "stop_id = excluded.stop_id, timetabled_time = excluded.timetabled_time, estimated_time = excluded.estimated_time, observed_at = excluded.observed_at " \
+            "WHERE excluded.observed_at >= observed_at AND excluded.estimated_time <> estimated_time",
+            [k + (v[0], _epoch(v[1]), _epoch(v[2]), _epoch(v[3])) for k, v in self._pending.items()]
+        )
+
+        return len(self._pending)
+
+    def discard(self) -> None:
+        self._pending.clear()
+
+    def clear(self) -> None:
+        for key, values in self._pending.items():
+            self._written[key] = values[2]
+            self._written.move_to_end(key)
+
+        self._pending.clear()
+
+        # keep the cache bounded, the calls written first are dropped first
+        while len(self._written) > self._max_size:
+            self._written.popitem(last=False)
+
+def _epoch(timestamp: str) -> int:
+    return int(datetime.datetime.fromisoformat(timestamp).timestamp())
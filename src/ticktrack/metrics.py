@@ -0,0 +1,144 @@
+import threading
+import time
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Dict
+from typing import Iterator
+from typing import Tuple
+
+class Metrics:
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+
+        # metrics are keyed by (name, labels), each value is kept cumulative for
+        # the endpoint and for the current summary window
+        self._counters: Dict[Tuple[str, tuple], float] = dict()
+        self._timings: Dict[Tuple[str, tuple], list] = dict()
+
+        self._window_counters: Dict[str, float] = dict()
+        self._window_timings: Dict[str, list] = dict()
+        self._window_start = time.time()
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._window_counters[name] = self._window_counters.get(name, 0) + value
+
+    def observe(self, name: str, duration: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._add_timing(self._timings, key, duration)
+
+            # per-station timings are aggregated for the summary
+            if len(labels) == 0:
+                self._add_timing(self._window_timings, name, duration)
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def summary(self, reset: bool = True) -> dict:
+        with self._lock:
+            now = time.time()
+
+            summary = {
+                'interval_s': round(now - self._window_start, 1),
+                'counters': dict(sorted(self._window_counters.items())),
+                'timings': {
+                    name: {
+                        'count': timing[0],
+                        'avg_ms': round(timing[1] / timing[0] * 1000, 2) if timing[0] > 0 else None,
+                        'max_ms': round(timing[2] * 1000, 2)
+                    } for name, timing in sorted(self._window_timings.items())
+                }
+            }
+
+            if reset:
+                self._window_counters = dict()
+                self._window_timings = dict()
+                self._window_start = now
+
+        return summary
+
+    def prometheus(self) -> str:
+        with self._lock:
+            counters = sorted(self._counters.items())
+            timings = sorted((k, list(v)) for k, v in self._timings.items())
+
+        lines = list()
+
+        for name in sorted(set(k[0] for k, _ in counters)):
+            lines.append(f"# TYPE ticktrack_{name}_total counter")
+            for (_, labels), value in [c for c in counters if c[0][0] == name]:
+                lines.append(f"ticktrack_{name}_total{_labels(labels)} {value}")
+
+        for name in sorted(set(k[0] for k, _ in timings)):
+            lines.append(f"# TYPE ticktrack_{name}_seconds summary")
+            for (_, labels), (count, total, maximum) in [t for t in timings if t[0][0] == name]:
+                lines.append(f"ticktrack_{name}_seconds_count{_labels(labels)} {count}")
+                lines.append(f"ticktrack_{name}_seconds_sum{_labels(labels)} {total}")
+                lines.append(f"ticktrack_{name}_seconds_max{_labels(labels)} {maximum}")
+
+        return "\n".join(lines) + "\n"
+
+    def _add_timing(self, timings: dict, key, duration: float) -> None:
+        timing = timings.get(key)
+        if timing is None:
+            timings[key] = [1, duration, duration]
+        else:
+            timing[0] = timing[0] + 1
+            timing[1] = timing[1] + duration
+            timing[2] = max(timing[2], duration)
+
+class MetricsServer:
+
+    def __init__(self, metrics: Metrics, host: str = '127.0.0.1', port: int = 9100) -> None:
+        self._metrics = metrics
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+
+    def start(self) -> None:
+        thread = threading.Thread(target=self._server.serve_forever, name='ticktrack-metrics', daemon=True)
+        thread.start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        metrics = self._metrics
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+
+                body = metrics.prometheus().encode('utf-8')
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def _labels(labels: tuple) -> str:
+    if len(labels) == 0:
+        return ''
+
+    values = [f"{k}=\"{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), chr(92) + 'n')}\"" for k, v in labels]
+    return '{' + ','.join(values) + '}'
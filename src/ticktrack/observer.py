@@ -0,0 +1,128 @@
+import json
+import logging
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from typing import List
+
+from ticktrack.archive import Archive
+from ticktrack.client import TriasClient
+from ticktrack.metrics import Metrics
+from ticktrack.scheduler import StationScheduler
+from ticktrack.store import TripStore
+from ticktrack.worker import MonitorWorker
+
+class Observer:
+
+    def __init__(self, worker: MonitorWorker, client: TriasClient, store: TripStore, scheduler: StationScheduler, line_ids: List[str]|None = None, max_concurrency: int = 8, metrics: Metrics|None = None, summary_interval: float|None = None, archive: Archive|None = None) -> None:
+        self._worker = worker
+        self._client = client
+        self._store = store
+        self._scheduler = scheduler
+        self._line_ids = line_ids
+        self._max_concurrency = max_concurrency
+        self._metrics = metrics if metrics is not None else Metrics()
+        self._summary_interval = summary_interval
+        self._last_summary = time.monotonic()
+        self._archive = archive
+
+    def run(self) -> None:
+        with ThreadPoolExecutor(max_workers=self._max_concurrency) as executor:
+            while True:
+
+                # wait until the next station is due
+                self._scheduler.wait()
+
+                due_station_ids = self._scheduler.pop_due(tolerance=5)
+                if len(due_station_ids) == 0:
+                    continue
+
+                # all stations which are not due in this cycle are skipped
+                self._metrics.increment('stations_skipped', len(self._scheduler))
+
+                start = time.monotonic()
+                self.poll(executor, due_station_ids)
+
+                # a cycle which takes longer than the poll interval delays the following stations
+                if time.monotonic() - start > self._scheduler.interval:
+                    self._metrics.increment('cycle_overrun')
+
+                self._log_summary()
+                self._archive_days()
+
+    def run_once(self) -> int:
+        # one single cycle for scheduled runs, stations which are not due yet are skipped
+        cycle_start = self._scheduler.now()
+        due_station_ids = self._scheduler.pop_due(tolerance=5)
+        self._metrics.increment('stations_skipped', len(self._scheduler))
+
+        if len(due_station_ids) > 0:
+            with ThreadPoolExecutor(max_workers=min(self._max_concurrency, len(due_station_ids))) as executor:
+                self.poll(executor, due_station_ids, cycle_start)
+        else:
+            logging.info('No stations are due')
+
+        self._log_summary(force=True)
+        self._archive_days()
+
+        return len(due_station_ids)
+
+    def poll(self, executor: ThreadPoolExecutor, station_ids: List[str], cycle_start: float|None = None) -> None:
+        logging.info(f"Performing observer requests for {len(station_ids)} stations ...")
+
+        start = time.perf_counter()
+
+        futures = dict()
+        for station_id in station_ids:
+
+            # run worker for this station
+            futures[executor.submit(self._worker.fetch, station_id)] = station_id
+
+        # process responses in the main thread as soon as they arrive
+        # there's only one database writer this way
+        for future in as_completed(futures):
+            station_id = futures[future]
+
+            # schedule next request depending on the departures which still need to be observed,
+            # scheduled runs start at fixed times, so their stations are due relative to the start of the cycle
+            departures = self._worker.process(station_id, future.result(), self._line_ids)
+            self._scheduler.reschedule(station_id, departures, cycle_start)
+
+        # write all changes of this cycle at once
+        with self._metrics.timer('flush'):
+            num_inserted, num_updated = self._store.flush()
+
+        logging.info(f"Inserted {num_inserted} and updated {num_updated} monitored trips")
+
+        self._metrics.increment('trips_inserted', num_inserted)
+        self._metrics.increment('trips_updated', num_updated)
+        self._metrics.observe('cycle', time.perf_counter() - start)
+
+        # report HTTP statistics of this cycle
+        statistics = self._client.statistics(reset=True)
+        self._metrics.increment('handshakes', statistics['handshakes'])
+        self._metrics.increment('retries', statistics['retries'])
+
+        logging.info(f"Finished {statistics['requests']} requests with {statistics['handshakes']} new connections, " \
+            f"avg. handshake {statistics['avg_handshake_ms']} ms, " \
+            f"avg. latency {statistics['avg_latency_new_connection_ms']} ms (new connection) / {statistics['avg_latency_reused_connection_ms']} ms (reused connection), " \
+            f"{statistics['retries']} retries, concurrency limit {statistics['concurrency_limit']}" + (", circuit breaker open" if statistics['circuit_open'] else ''))
+
+    def _log_summary(self, force: bool = False) -> None:
+        if self._summary_interval is None or (not force and time.monotonic() - self._last_summary < self._summary_interval):
+            return
+
+        self._last_summary = time.monotonic()
+        logging.info(f"Metrics summary {json.dumps(self._metrics.summary(reset=True))}")
+
+    def _archive_days(self) -> None:
+        if self._archive is None:
+            return
+
+        # finished operation days are moved out of the database once a day
+        try:
+            with self._metrics.timer('archive'):
+                self._archive.run()
+        except Exception as ex:
+            logging.error(ex)
@@ -0,0 +1,165 @@
+import array
+import csv
+import heapq
+import io
+import logging
+import operator
+import zipfile
+
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import TextIO
+from typing import Tuple
+
+class CoveringStation(NamedTuple):
+    station_id: str
+    name: str|None
+    num_trips: int
+    num_departures: int
+
+class StationOptimizer:
+
+    def __init__(self, line_ids: List[str]|None = None, parent_stations: bool = False, weighted: bool = False) -> None:
+        self._line_ids = line_ids
+        self._parent_stations = parent_stations
+        self._weighted = weighted
+
+    def run(self, filename: str) -> List[CoveringStation]:
+        with zipfile.ZipFile(filename) as feed:
+            stops = self._stops(feed)
+
+            # trips are numbered in order to represent sets of trips as bitsets
+            trips: Dict[str, int] = dict()
+            for route_id, trip_id in _read(feed, 'trips.txt', ['route_id', 'trip_id']):
+                if self._line_ids is None or any(route_id.startswith(id) for id in self._line_ids):
+                    trips[trip_id] = len(trips)
+
+            # stop times are streamed, only the trips of each station are kept
+            trips_by_station: Dict[str, array.array] = dict()
+            departures_by_station: Dict[str, int] = dict()
+
+            # trips are never returned as departure at their last stop, as the last stop of a trip is known only
+            # after all of its stop times have been read, the stop with the highest sequence so far is held back
+            last_stops: Dict[str, Tuple[int, str, str]] = dict()
+            for trip_id, station_id, stop_sequence, pickup_type in _read(feed, 'stop_times.txt', ['trip_id', 'stop_id', 'stop_sequence', 'pickup_type']):
+                if station_id in stops:
+                    station_id = stops[station_id][0]
+
+                stop = (int(stop_sequence), station_id, pickup_type)
+
+                last_stop = last_stops.get(trip_id)
+                if last_stop is None or stop[0] > last_stop[0]:
+                    last_stops[trip_id] = stop
+                    if last_stop is None:
+                        continue
+
+                    stop = last_stop
+
+                _, station_id, pickup_type = stop
+
+                # neither are trips returned at stops where passengers can't board
+                if pickup_type.strip() == '1':
+                    continue
+
+                departures_by_station[station_id] = departures_by_station.get(station_id, 0) + 1
+
+                index = trips.get(trip_id)
+                if index is None:
+                    continue
+
+                indices = trips_by_station.get(station_id)
+                if indices is None:
+                    indices = array.array('I')
+                    trips_by_station[station_id] = indices
+
+                indices.append(index)
+
+        bitsets = {s: _bitset(i, len(trips)) for s, i in trips_by_station.items()}
+        logging.info(f"Found {len(trips)} trips at {len(bitsets)} stations")
+
+        selected = self._cover(bitsets, departures_by_station)
+
+        names = {s[0]: s[1] for s in stops.values()}
+        return [CoveringStation(s, names.get(s), bitsets[s].bit_count(), departures_by_station[s]) for s in selected]
+
+    def _cover(self, bitsets: Dict[str, int], departures: Dict[str, int]) -> List[str]:
+        # greedy set cover, the station covering the most trips which are not covered yet (per departure
+        # if weighted) is chosen next, gains can only decrease so outdated heap entries are re-evaluated lazily
+        def cost(station_id: str) -> float:
+            return departures[station_id] if self._weighted else 1
+
+        heap = [(-bits.bit_count() / cost(s), s) for s, bits in bitsets.items()]
+        heapq.heapify(heap)
+
+        covered = 0
+        selected = list()
+        while len(heap) > 0:
+            _, station_id = heapq.heappop(heap)
+
+            gain = (bitsets[station_id] & ~covered).bit_count() / cost(station_id)
+            if gain == 0:
+                continue
+
+            if len(heap) > 0 and gain < -heap[0][0]:
+                heapq.heappush(heap, (-gain, station_id))
+                continue
+
+            covered = covered | bitsets[station_id]
+            selected.append(station_id)
+
+        # remove stations whose trips are covered by the other stations as well
+        for station_id in list(reversed(selected)):
+            others = 0
+            for other_id in selected:
+                if other_id != station_id:
+                    others = others | bitsets[other_id]
+
+            if bitsets[station_id] & ~others == 0:
+                selected.remove(station_id)
+
+        return selected
+
+    def _stops(self, feed: zipfile.ZipFile) -> Dict[str, tuple]:
+        # maps each stop ID to its station ID and name, stops are mapped to their parent station if requested
+        stops = dict()
+        for stop_id, name, parent_station in _read(feed, 'stops.txt', ['stop_id', 'stop_name', 'parent_station']):
+            stops[stop_id] = (parent_station, name)
+
+        names = {stop_id: s[1] for stop_id, s in stops.items()}
+        for stop_id, (parent_station, name) in stops.items():
+            if self._parent_stations and parent_station != '':
+                stops[stop_id] = (parent_station, names.get(parent_station, name))
+            else:
+                stops[stop_id] = (stop_id, name)
+
+        return stops
+
+    @classmethod
+    def write(cls, stations: List[CoveringStation], output: TextIO) -> None:
+        # ready to be used as stations block of the config
+        output.write("stations:\n")
+        for station in stations:
+            output.write(f"  - {station.station_id:<30} # {station.name or ''}, {station.num_trips} trips\n")
+
+def _bitset(indices: array.array, size: int) -> int:
+    bits = bytearray((size + 7) // 8)
+    for index in indices:
+        bits[index >> 3] |= 1 << (index & 7)
+
+    return int.from_bytes(bits, 'little')
+
+def _read(feed: zipfile.ZipFile, name: str, columns: List[str]) -> Iterator[tuple]:
+    # yields the values of the given columns only, missing optional columns are empty
+    with feed.open(name, 'r') as gtfs_file:
+        reader = csv.reader(io.TextIOWrapper(gtfs_file, encoding='utf-8-sig', newline=''))
+
+        header = {c.strip(): i for i, c in enumerate(next(reader, []))}
+        indices = [header.get(c) for c in columns]
+
+        if None not in indices:
+            yield from map(operator.itemgetter(*indices), filter(None, reader))
+        else:
+            for row in filter(None, reader):
+                yield tuple(row[i] if i is not None and i < len(row) else '' for i in indices)
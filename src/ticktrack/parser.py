@@ -0,0 +1,336 @@
+import re
+
+from lxml.etree import fromstring
+from typing import List
+from typing import NamedTuple
+from typing import Tuple
+
+_NS = '{http://www.vdv.de/trias}'
+_SIRI_NS = '{http://www.siri.org.uk/siri}'
+
+_SERVICE_DELIVERY = f"{_NS}ServiceDelivery"
+_STATUS = f"{_SIRI_NS}Status"
+_DELIVERY_PAYLOAD = f"{_NS}DeliveryPayload"
+_STOP_EVENT_RESPONSE = f"{_NS}StopEventResponse"
+_ERROR_MESSAGE = f"{_NS}ErrorMessage"
+_CODE = f"{_NS}Code"
+_STOP_EVENT_RESULT = f"{_NS}StopEventResult"
+_STOP_EVENT = f"{_NS}StopEvent"
+_SERVICE = f"{_NS}Service"
+_PREVIOUS_CALL = f"{_NS}PreviousCall"
+_THIS_CALL = f"{_NS}ThisCall"
+_ONWARD_CALL = f"{_NS}OnwardCall"
+_CALL_AT_STOP = f"{_NS}CallAtStop"
+_STOP_POINT_REF = f"{_NS}StopPointRef"
+_STOP_SEQ_NUMBER = f"{_NS}StopSeqNumber"
+_SERVICE_ARRIVAL = f"{_NS}ServiceArrival"
+_SERVICE_DEPARTURE = f"{_NS}ServiceDeparture"
+_TIMETABLED_TIME = f"{_NS}TimetabledTime"
+_ESTIMATED_TIME = f"{_NS}EstimatedTime"
+_NOT_SERVICED_STOP = f"{_NS}NotServicedStop"
+_UNPLANNED_STOP = f"{_NS}UnplannedStop"
+_TEXT = f"{_NS}Text"
+
+# values which are evaluated as false by lxml.objectify, everything else
+# but an empty text is considered as true
+_FALSE_VALUE = re.compile(r'false|[+-]?(0+(\.0*)?|\.0+)')
+
+_NAMESPACE_PREFIX = re.compile(rb'(?:[\w.-]+:)?')
+_NAMESPACE_DECLARATION = re.compile(rb'xmlns(?::[\w.-]+)?\s*=\s*(?:"[^"]*"|\'[^\']*\')')
+
+class StopEventResponseError(Exception):
+    pass
+
+class StopCall(NamedTuple):
+    stop_id: str|None
+    sequence: int
+    timetabled_time: str
+    estimated_time: str
+
+class StopEventRecord(NamedTuple):
+    operation_day: str|None
+    trip_id: str|None
+    line_id: str|None
+    line_name: str|None
+    origin_stop_id: str|None
+    origin_name: str|None
+    destination_stop_id: str|None
+    destination_name: str|None
+    start_time: str|None
+    end_time: str|None
+    departure_time: str|None
+    realtime: bool
+    cancelled: int
+    num_cancelled_stops: int
+    num_added_stops: int
+    calls: Tuple[StopCall, ...]|None = None
+
+def parse_stop_event_response(xml: bytes, calls: bool = False) -> List[StopEventRecord]:
+    # parse the document once and visit each StopEventResult exactly once, all lookups
+    # below are done by lxml directly instead of attribute access on an objectify tree
+    root = fromstring(xml)
+
+    records = list()
+    for stop_event_result in root.iter(_STOP_EVENT_RESULT):
+        stop_event = stop_event_result.find(_STOP_EVENT)
+        if stop_event is not None:
+            records.append(_stop_event_record(stop_event, calls))
+
+    # a response without any results is either empty or an error, which must not be
+    # mistaken for a station without departures
+    if len(records) == 0:
+        _check_stop_event_response(root)
+
+    return records
+
+def split_stop_event_response(xml: bytes) -> Tuple[bytes, List[bytes]]:
+    # returns the namespace declarations of the document and each raw StopEventResult
+    # which are cut out without parsing, declarations are required for parsing single results
+    fragments = list()
+
+    # find the first start tag, all results use the same tag including the namespace prefix
+    start = xml.find(b'StopEventResult')
+    while start >= 0:
+        begin = xml.rfind(b'<', 0, start)
+        if begin >= 0 and _NAMESPACE_PREFIX.fullmatch(xml, begin + 1, start) is not None:
+            break
+
+        start = xml.find(b'StopEventResult', start + 1)
+
+    if start < 0:
+        return (b'', fragments)
+
+    open_tag = xml[begin:start + len(b'StopEventResult')]
+    close_tag = b'</' + open_tag[1:] + b'>'
+
+    header = xml[:begin]
+
+    position = begin
+    while True:
+        begin = xml.find(open_tag, position)
+        if begin < 0:
+            break
+
+        # skip other elements starting with the same name
+        if xml[begin + len(open_tag):begin + len(open_tag) + 1] not in (b'>', b' ', b'\t', b'\r', b'\n', b'/'):
+            position = begin + len(open_tag)
+            continue
+
+        end = xml.find(close_tag, begin)
+        if end < 0:
+            break
+
+        fragments.append(xml[begin:end + len(close_tag)])
+        position = end + len(close_tag)
+
+    namespaces = b' '.join(dict.fromkeys(_NAMESPACE_DECLARATION.findall(header)))
+
+    return (namespaces, fragments)
+
+def parse_stop_event_result(fragment: bytes, namespaces: bytes = b'', calls: bool = False) -> StopEventRecord|None:
+    root = fromstring(b'<Fragment ' + namespaces + b'>' + fragment + b'</Fragment>')
+
+    stop_event = root[0].find(_STOP_EVENT)
+    if stop_event is None:
+        return None
+
+    return _stop_event_record(stop_event, calls)
+
+def fingerprint(fragment: bytes, estimated_times: bool = False) -> int:
+    # estimated times are left out as only their presence is relevant for the records,
+    # unless the estimated times of the calls are recorded as well
+    if estimated_times:
+        return hash(fragment)
+
+    parts = fragment.split(b'EstimatedTime>')
+
+    return hash(parts[0] + b''.join(p[p.find(b'<'):] for p in parts[1:]))
+
+def _check_stop_event_response(root) -> None:
+    service_delivery = root.find(_SERVICE_DELIVERY)
+    if service_delivery is None:
+        raise StopEventResponseError('response contains no ServiceDelivery')
+
+    status = _text(_first(service_delivery, _STATUS))
+    if status is not None and not _is_true(status.strip()):
+        raise StopEventResponseError('response status is false')
+
+    stop_event_response = _first(_first(service_delivery, _DELIVERY_PAYLOAD), _STOP_EVENT_RESPONSE)
+    if stop_event_response is None:
+        raise StopEventResponseError('response contains no StopEventResponse')
+
+    error_message = _first(stop_event_response, _ERROR_MESSAGE)
+    if error_message is not None:
+        code = _text(_first(error_message, _CODE))
+        text = _text(_first(_first(error_message, _TEXT), _TEXT))
+
+        raise StopEventResponseError(f"response contains error {code}: {text}")
+
+def _stop_event_record(stop_event, calls: bool = False) -> StopEventRecord:
+    service = stop_event.find(_SERVICE)
+    this_call = stop_event.find(_THIS_CALL)
+    first_previous_call = stop_event.find(_PREVIOUS_CALL)
+    last_onward_call = None
+
+    for child in reversed(stop_event):
+        if child.tag == _ONWARD_CALL:
+            last_onward_call = child
+            break
+
+    # read all service fields within one iteration over its children
+    service_values = dict()
+    cancelled = 0
+    if service is not None:
+        for child in service:
+            if not isinstance(child.tag, str) or not child.tag.startswith(_NS):
+                continue
+
+            tag = child.tag[len(_NS):]
+            if tag in service_values:
+                continue
+
+            if tag in ('PublishedLineName', 'OriginText', 'DestinationText'):
+                service_values[tag] = _text(child.find(_TEXT))
+            else:
+                service_values[tag] = child.text
+
+        if 'Cancelled' in service_values and _is_true(service_values['Cancelled']):
+            cancelled = 1
+
+    # extract nominal start and end time of the trip
+    this_call_at_stop = _first(this_call, _CALL_AT_STOP)
+    this_call_departure = _first(this_call_at_stop, _SERVICE_DEPARTURE)
+    this_call_arrival = _first(this_call_at_stop, _SERVICE_ARRIVAL)
+
+    if first_previous_call is not None:
+        start_time = _iso(_text(_first(_first(_first(first_previous_call, _CALL_AT_STOP), _SERVICE_DEPARTURE), _TIMETABLED_TIME)))
+    elif this_call is not None:
+        start_time = _iso(_text(_first(this_call_departure, _TIMETABLED_TIME)))
+    else:
+        start_time = ""
+
+    if last_onward_call is not None:
+        end_time = _iso(_text(_first(_first(_first(last_onward_call, _CALL_AT_STOP), _SERVICE_ARRIVAL), _TIMETABLED_TIME)))
+    elif this_call is not None:
+        end_time = start_time
+    else:
+        end_time = ""
+
+    if this_call_departure is not None:
+        departure_time = _iso(_text(_first(this_call_departure, _TIMETABLED_TIME)))
+    elif this_call_arrival is not None:
+        departure_time = _iso(_text(_first(this_call_arrival, _TIMETABLED_TIME)))
+    else:
+        departure_time = None
+
+    # count cancelled and added stops over all calls, only the flags themselves are visited
+    # and checked for being the first of their kind in the first CallAtStop of a call
+    num_cancelled_stops = 0
+    num_added_stops = 0
+
+    for flag in stop_event.iter(_NOT_SERVICED_STOP, _UNPLANNED_STOP):
+        if not _is_true(flag.text):
+            continue
+        
+        call_at_stop = flag.getparent()
+        call = call_at_stop.getparent()
+
+        if call is None or call.getparent() is not stop_event:
+            continue
+
+        if not (call.tag == _PREVIOUS_CALL or call.tag == _ONWARD_CALL or call is this_call):
+            continue
+
+        if call_at_stop.tag != _CALL_AT_STOP or call.find(_CALL_AT_STOP) is not call_at_stop or call_at_stop.find(flag.tag) is not flag:
+            continue
+
+        if flag.tag == _NOT_SERVICED_STOP:
+            num_cancelled_stops = num_cancelled_stops + 1
+        else:
+            num_added_stops = num_added_stops + 1
+
+    return StopEventRecord(
+        operation_day=service_values.get('OperatingDayRef'),
+        trip_id=service_values.get('JourneyRef'),
+        line_id=service_values.get('LineRef'),
+        line_name=service_values.get('PublishedLineName'),
+        origin_stop_id=service_values.get('OriginStopPointRef'),
+        origin_name=service_values.get('OriginText'),
+        destination_stop_id=service_values.get('DestinationStopPointRef'),
+        destination_name=service_values.get('DestinationText'),
+        start_time=start_time,
+        end_time=end_time,
+        departure_time=departure_time,
+        realtime=_first(this_call_departure, _ESTIMATED_TIME) is not None,
+        cancelled=cancelled,
+        num_cancelled_stops=num_cancelled_stops,
+        num_added_stops=num_added_stops,
+        calls=_stop_calls(stop_event) if calls else None
+    )
+
+def _stop_calls(stop_event) -> Tuple[StopCall, ...]:
+    # all values of the calls are visited within one iteration in document order, times
+    # belong to the arrival or departure seen last within the current CallAtStop
+    calls = list()
+    values = None
+    offset = 0
+
+    for element in stop_event.iter(_CALL_AT_STOP, _STOP_POINT_REF, _STOP_SEQ_NUMBER, _SERVICE_ARRIVAL, _SERVICE_DEPARTURE, _TIMETABLED_TIME, _ESTIMATED_TIME):
+        tag = element.tag
+        if tag == _CALL_AT_STOP:
+            _append_stop_call(calls, values)
+
+            # stop ID, sequence, timetabled and estimated arrival, timetabled and estimated departure
+            values = [None, None, None, None, None, None]
+            offset = 0
+        elif values is None:
+            continue
+        elif tag == _TIMETABLED_TIME:
+            if offset > 0:
+                values[offset] = element.text
+        elif tag == _ESTIMATED_TIME:
+            if offset > 0:
+                values[offset + 1] = element.text
+        elif tag == _SERVICE_ARRIVAL:
+            offset = 2
+        elif tag == _SERVICE_DEPARTURE:
+            offset = 4
+        elif tag == _STOP_POINT_REF:
+            values[0] = element.text
+        else:
+            values[1] = element.text
+
+    _append_stop_call(calls, values)
+
+    return tuple(calls)
+
+def _append_stop_call(calls: List[StopCall], values: list|None) -> None:
+    # the departure is used if available, the arrival otherwise, calls without
+    # sequence number can't be identified and calls without realtime are skipped
+    if values is None or values[1] is None:
+        return
+
+    if values[4] is not None:
+        timetabled_time, estimated_time = values[4], values[5]
+    else:
+        timetabled_time, estimated_time = values[2], values[3]
+
+    if timetabled_time is None or estimated_time is None:
+        return
+
+    try:
+        calls.append(StopCall(values[0], int(values[1]), _iso(timetabled_time), _iso(estimated_time)))
+    except ValueError:
+        return
+
+def _first(element, tag: str):
+    return element.find(tag) if element is not None else None
+
+def _text(element) -> str|None:
+    return element.text if element is not None else None
+
+def _iso(timestamp: str|None) -> str|None:
+    return timestamp.replace('Z', '+00:00') if timestamp is not None else None
+
+def _is_true(value: str|None) -> bool:
+    return value is not None and value != '' and _FALSE_VALUE.fullmatch(value) is None
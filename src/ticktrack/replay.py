@@ -0,0 +1,107 @@
+import datetime
+import logging
+import os
+import re
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+
+from ticktrack.datalog import DatalogReader
+from ticktrack.parser import StopEventRecord
+from ticktrack.parser import parse_stop_event_response
+from ticktrack.store import TripStore
+from ticktrack.worker import MonitorWorker
+
+_STOP_POINT_REF = re.compile(rb'<(?:\w+:)?StopPointRef>([^<]*)</(?:\w+:)?StopPointRef>')
+
+class RecordedResponse(NamedTuple):
+    timestamp: str
+    station_id: str
+    filename: str
+    offset: int|None
+    length: int|None
+
+class Replay:
+
+    def __init__(self, store: TripStore, line_ids: List[str]|None = None, processes: int|None = None, batch_size: int = 500) -> None:
+        self._store = store
+        self._line_ids = line_ids
+        self._processes = processes
+        self._batch_size = batch_size
+
+        # the worker is used for processing only, it never performs a request
+        self._worker = MonitorWorker(None, None, None, self._store)
+
+    def run(self, directory: str) -> int:
+        responses = sorted(self._recorded_responses(directory), key=lambda r: r.timestamp)
+
+        logging.info(f"Replaying {len(responses)} recorded responses ...")
+
+        num_processed = 0
+        with ProcessPoolExecutor(max_workers=self._processes) as executor:
+
+            # responses are parsed in parallel in batches, but processed strictly in timestamp order
+            for n in range(0, len(responses), self._batch_size):
+                batch = responses[n:n + self._batch_size]
+
+                for response, records in zip(batch, executor.map(_load_and_parse, batch, chunksize=16)):
+                    if records is None:
+                        continue
+
+                    self._worker.process(response.station_id, records, self._line_ids, response.timestamp)
+                    num_processed = num_processed + 1
+
+                num_inserted, num_updated = self._store.flush()
+                logging.info(f"Replayed {n + len(batch)} of {len(responses)} responses, inserted {num_inserted} and updated {num_updated} monitored trips")
+
+        return num_processed
+
+    def _recorded_responses(self, directory: str) -> Iterator[RecordedResponse]:
+
+        # responses recorded in datalog segments
+        reader = DatalogReader(directory)
+        for segment in reader.segments():
+            for index in reader.index(segment):
+                if len(index['tags']) > 0 and index['tags'][-1] == 'Response' and 'station_id' in index['meta']:
+                    yield RecordedResponse(
+                        _iso_timestamp(datetime.datetime.fromisoformat(index['timestamp'])),
+                        index['meta']['station_id'],
+                        os.path.join(directory, f"{segment}.log.gz"),
+                        index['offset'],
+                        index['length']
+                    )
+
+        # responses recorded as single XML files by previous versions, the station ID is taken
+        # from the request which has been logged right before each response
+        station_id = None
+        for filename in sorted(f for f in os.listdir(directory) if f.endswith('.xml')):
+            if filename.endswith('-Request.xml'):
+                with open(os.path.join(directory, filename), 'rb') as request_file:
+                    match = _STOP_POINT_REF.search(request_file.read())
+                    station_id = match.group(1).decode('utf-8') if match is not None else None
+
+            elif filename.endswith('-Response.xml') and station_id is not None:
+                timestamp = datetime.datetime.strptime(filename.split('_')[0], '%Y-%m-%d-%H.%M.%S-%f').astimezone()
+                yield RecordedResponse(_iso_timestamp(timestamp), station_id, os.path.join(directory, filename), None, None)
+
+                station_id = None
+
+def _load_and_parse(response: RecordedResponse) -> List[StopEventRecord]|None:
+    # runs in a separate process, payloads are read there in order not to transfer them
+    try:
+        if response.offset is not None:
+            data = DatalogReader.read(response.filename, response.offset, response.length)
+        else:
+            with open(response.filename, 'rb') as response_file:
+                data = response_file.read()
+
+        return parse_stop_event_response(data)
+    except Exception as ex:
+        logging.error(f"Failed to parse {response.filename}: {ex}")
+
+        return None
+
+def _iso_timestamp(timestamp: datetime.datetime) -> str:
+    return timestamp.astimezone(datetime.timezone.utc).replace(microsecond=0).isoformat()
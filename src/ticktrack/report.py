@@ -0,0 +1,75 @@
+import csv
+import json
+
+from sqlobject import sqlhub
+from typing import List
+from typing import TextIO
+
+class Report:
+
+    def __init__(self, connection=None) -> None:
+        self._connection = connection if connection is not None else sqlhub.processConnection
+
+    def daily(self, from_day: str|None = None, to_day: str|None = None, line_ids: List[str]|None = None) -> List[dict]:
+        return self._query(
+            "SELECT operation_day, line_id, line_name, num_trips, num_realtime, ROUND(CAST(num_realtime AS REAL) / num_trips, 4) AS realtime_coverage, " \
+            "num_cancelled, num_cancelled_stops, num_added_stops " \
+            "FROM line_summary WHERE {filter} ORDER BY operation_day, line_id",
+            from_day, to_day, line_ids
+        )
+
+    def coverage(self, from_day: str|None = None, to_day: str|None = None, line_ids: List[str]|None = None) -> List[dict]:
+        return self._query(
+            "SELECT line_id, MAX(line_name) AS line_name, MIN(operation_day) AS first_day, MAX(operation_day) AS last_day, COUNT(*) AS num_days, " \
+            "SUM(num_trips) AS num_trips, SUM(num_realtime) AS num_realtime, ROUND(CAST(SUM(num_realtime) AS REAL) / SUM(num_trips), 4) AS realtime_coverage, " \
+            "SUM(num_realtime = 0) AS num_days_without_realtime " \
+            "FROM line_summary WHERE {filter} GROUP BY line_id ORDER BY realtime_coverage, line_id",
+            from_day, to_day, line_ids
+        )
+
+    def cancellations(self, from_day: str|None = None, to_day: str|None = None, line_ids: List[str]|None = None) -> List[dict]:
+        return self._query(
+            "SELECT line_id, MAX(line_name) AS line_name, SUM(num_trips) AS num_trips, " \
+            "SUM(num_cancelled) AS num_cancelled, ROUND(CAST(SUM(num_cancelled) AS REAL) / SUM(num_trips), 4) AS cancelled_ratio, " \
+            "SUM(num_cancelled_stops) AS num_cancelled_stops, SUM(num_added_stops) AS num_added_stops " \
+            "FROM line_summary WHERE {filter} GROUP BY line_id ORDER BY cancelled_ratio DESC, line_id",
+            from_day, to_day, line_ids
+        )
+
+    @classmethod
+    def write(cls, rows: List[dict], output: TextIO, format: str = 'csv') -> None:
+        if format == 'json':
+            json.dump(rows, output, indent=2)
+            output.write("\n")
+        else:
+            writer = csv.writer(output, lineterminator="\n")
+            if len(rows) > 0:
+                writer.writerow(rows[0].keys())
+                writer.writerows(r.values() for r in rows)
+
+    def _query(self, query: str, from_day: str|None, to_day: str|None, line_ids: List[str]|None) -> List[dict]:
+        conditions = ['num_trips > 0']
+        parameters = list()
+
+        if from_day is not None:
+            conditions.append('operation_day >= ?')
+            parameters.append(from_day)
+
+        if to_day is not None:
+            conditions.append('operation_day <= ?')
+            parameters.append(to_day)
+
+        # line IDs are compared by their prefix as everywhere else
+        if line_ids is not None and len(line_ids) > 0:
+            conditions.append('(' + ' OR '.join('substr(line_id, 1, ?) = ?' for _ in line_ids) + ')')
+            for line_id in line_ids:
+                parameters.extend([len(line_id), line_id])
+
+        connection = self._connection.getConnection()
+        try:
+            cursor = connection.execute(query.format(filter=' AND '.join(conditions)), parameters)
+            columns = [c[0] for c in cursor.description]
+
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        finally:
+            self._connection.releaseConnection(connection)
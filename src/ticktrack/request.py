@@ -51,12 +51,47 @@ class StopEventRequest(ServiceRequest):
         self.Trias.ServiceRequest.RequestPayload.StopEventRequest.DepArrTime = dep_arr_time
 
         self.Trias.ServiceRequest.RequestPayload.StopEventRequest.Params = Element('Params')
-        self.Trias.ServiceRequest.RequestPayload.StopEventRequest.Params.NumberOfResults = str(20)
+        self.Trias.ServiceRequest.RequestPayload.StopEventRequest.Params.NumberOfResults = str(num_results)
         self.Trias.ServiceRequest.RequestPayload.StopEventRequest.Params.StopEventType = 'departure'
         self.Trias.ServiceRequest.RequestPayload.StopEventRequest.Params.IncludeRealtimeData = str(True).lower()
         self.Trias.ServiceRequest.RequestPayload.StopEventRequest.Params.IncludePreviousCalls = str(True).lower()
         self.Trias.ServiceRequest.RequestPayload.StopEventRequest.Params.IncludeOnwardCalls = str(True).lower()
 
+class StopEventRequestTemplate:
+
+    _REQUEST_TIMESTAMP = 'ticktrack-request-timestamp'
+    _STOP_POINT_REF = 'ticktrack-stop-point-ref'
+    _DEP_ARR_TIME = 'ticktrack-dep-arr-time'
+
+    def __init__(self, requestor_ref: str, num_results: int = 20) -> None:
+        
+        # build the request once with placeholders and split the serialized XML at them,
+        # rendering a request only fills in the variable values afterwards
+        request = StopEventRequest(requestor_ref, self._STOP_POINT_REF, self._DEP_ARR_TIME, num_results)
+        request.Trias.ServiceRequest.find('{http://www.siri.org.uk/siri}RequestTimestamp')._setText(self._REQUEST_TIMESTAMP)
+
+        xml = request.xml()
+
+        self._parts = list()
+        for placeholder in (self._REQUEST_TIMESTAMP, self._STOP_POINT_REF, self._DEP_ARR_TIME):
+            head, xml = xml.split(placeholder.encode('utf-8'))
+            self._parts.append(head)
+
+        self._parts.append(xml)
+
+    def render(self, stop_point_ref: str, dep_arr_time: str, request_timestamp: str|None = None) -> bytes:
+        request_timestamp = request_timestamp if request_timestamp is not None else _timestamp()
+
+        return b''.join((
+            self._parts[0], 
+            _escape(request_timestamp), 
+            self._parts[1], 
+            _escape(stop_point_ref), 
+            self._parts[2], 
+            _escape(dep_arr_time), 
+            self._parts[3]
+        ))
+
 def _timestamp(additional_seconds=0) -> str:
     ts = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
     ts = ts + datetime.timedelta(seconds=additional_seconds)
@@ -67,4 +102,8 @@ def xml2trias_request(xml: str) -> TriasRequest:
     request = TriasRequest()
     request.Trias = fromstring(xml)
 
-    return request
\ No newline at end of file
+    return request
+
+def _escape(text: str) -> bytes:
+    # same escaping of text content as done by lxml
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('\r', '&#13;').encode('utf-8')
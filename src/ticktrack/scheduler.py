@@ -0,0 +1,105 @@
+import heapq
+import itertools
+import time
+
+from typing import Callable
+from typing import Dict
+from typing import List
+
+class StationScheduler:
+
+    def __init__(self, interval: float = 60, lead_time: float = 300, max_interval: float = 1800, clock: Callable[[], float] = time.time, sleep: Callable[[float], None] = time.sleep) -> None:
+        self._interval = interval
+        self._lead_time = lead_time
+        self._max_interval = max_interval
+        self._clock = clock
+        self._sleep = sleep
+
+        # priority queue of (due, sequence, station_id), outdated entries are skipped
+        # lazily as the current due time of each station is kept separately
+        self._queue = list()
+        self._due: Dict[str, float] = dict()
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    @property
+    def interval(self) -> float:
+        return self._interval
+
+    def add(self, station_id: str, due: float|None = None) -> None:
+        due = due if due is not None else self._clock()
+
+        self._due[station_id] = due
+        heapq.heappush(self._queue, (due, next(self._sequence), station_id))
+
+    def remove(self, station_id: str) -> None:
+        self._due.pop(station_id, None)
+
+    def due(self, station_id: str) -> float|None:
+        return self._due.get(station_id)
+
+    def next_due(self) -> float|None:
+        self._discard_outdated()
+
+        return self._queue[0][0] if len(self._queue) > 0 else None
+
+    def pop_due(self, tolerance: float = 0) -> List[str]:
+        # return all stations which are due now, stations due within the tolerance
+        # are included in order to combine them into one batch of requests
+        now = self._clock()
+
+        station_ids = list()
+        while True:
+            self._discard_outdated()
+            if len(self._queue) == 0 or self._queue[0][0] > now + tolerance:
+                break
+
+            _, _, station_id = heapq.heappop(self._queue)
+            del self._due[station_id]
+
+            station_ids.append(station_id)
+
+        return station_ids
+
+    def wait(self) -> None:
+        # without any station there is nothing to wait for, avoid a busy loop of the caller
+        next_due = self.next_due()
+        if next_due is not None:
+            self._sleep(max(0, next_due - self._clock()))
+        else:
+            self._sleep(self._interval)
+
+    def now(self) -> float:
+        return self._clock()
+
+    def reschedule(self, station_id: str, departures: List[float]|None, now: float|None = None) -> float:
+        due = self.due_time(departures, now if now is not None else self._clock())
+        self.add(station_id, due)
+
+        return due
+
+    def due_time(self, departures: List[float]|None, now: float) -> float:
+        # poll again after the default interval if the last request failed
+        if departures is None:
+            return now + self._interval
+
+        # nothing to observe in the visible window, poll with the max. interval only
+        upcoming = [d for d in departures if d >= now]
+        if len(upcoming) == 0:
+            return now + self._max_interval
+
+        # realtime data are expected to appear within the lead time before a departure,
+        # the station needs to be polled with the default interval from then on
+        due = min(upcoming) - self._lead_time
+
+        return min(max(due, now + self._interval), now + self._max_interval)
+
+    def _discard_outdated(self) -> None:
+        while len(self._queue) > 0:
+            due, _, station_id = self._queue[0]
+            if self._due.get(station_id) == due:
+                break
+
+            heapq.heappop(self._queue)
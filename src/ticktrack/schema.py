@@ -0,0 +1,354 @@
+import logging
+
+from sqlobject import sqlhub
+
+from ticktrack.model import MonitoredTrip
+
+class Schema:
+
+    # each migration is a list of SQL statements which are executed within one transaction,
+    # the index of a migration in this list + 1 is the schema version after applying it
+    _migrations = [
+        [
+            # merge duplicate trips into the first row which has been inserted for them
+            "CREATE INDEX IF NOT EXISTS monitored_trip_duplicates ON monitored_trip (operation_day, trip_id)",
+            "UPDATE monitored_trip SET " \
+                "realtime_first_appeared = (SELECT MIN(d.realtime_first_appeared) FROM monitored_trip d WHERE d.operation_day = monitored_trip.operation_day AND d.trip_id = monitored_trip.trip_id), " \
+                "realtime_cancelled = (SELECT MAX(d.realtime_cancelled) FROM monitored_trip d WHERE d.operation_day = monitored_trip.operation_day AND d.trip_id = monitored_trip.trip_id), " \
+                "realtime_num_cancelled_stops = (SELECT MAX(d.realtime_num_cancelled_stops) FROM monitored_trip d WHERE d.operation_day = monitored_trip.operation_day AND d.trip_id = monitored_trip.trip_id), " \
+                "realtime_num_added_stops = (SELECT MAX(d.realtime_num_added_stops) FROM monitored_trip d WHERE d.operation_day = monitored_trip.operation_day AND d.trip_id = monitored_trip.trip_id) " \
+                "WHERE id IN (SELECT MIN(id) FROM monitored_trip GROUP BY operation_day, trip_id HAVING COUNT(*) > 1)",
+            "DELETE FROM monitored_trip WHERE id NOT IN (SELECT MIN(id) FROM monitored_trip GROUP BY operation_day, trip_id)",
+            "DROP INDEX monitored_trip_duplicates",
+
+            # lookup of trips by the worker and analytics per line
+            "CREATE UNIQUE INDEX monitored_trip_operation_day_trip_id ON monitored_trip (operation_day, trip_id)",
+            "CREATE INDEX monitored_trip_line_id_operation_day ON monitored_trip (line_id, operation_day)"
+        ],
+        [
+            # daily summary per line which is maintained by triggers with every write of a trip,
+            # summaries are kept when trips are deleted in order to report over the whole history
+            "CREATE TABLE line_summary (" \
+                "operation_day TEXT NOT NULL, " \
+                "line_id TEXT NOT NULL, " \
+                "line_name TEXT, " \
+                "num_trips INTEGER NOT NULL DEFAULT 0, " \
+                "num_realtime INTEGER NOT NULL DEFAULT 0, " \
+                "num_cancelled INTEGER NOT NULL DEFAULT 0, " \
+                "num_cancelled_stops INTEGER NOT NULL DEFAULT 0, " \
+                "num_added_stops INTEGER NOT NULL DEFAULT 0, " \
+                "PRIMARY KEY (operation_day, line_id)" \
+            ") WITHOUT ROWID",
+            "INSERT INTO line_summary (operation_day, line_id, line_name, num_trips, num_realtime, num_cancelled, num_cancelled_stops, num_added_stops) " \
+                "SELECT operation_day, COALESCE(line_id, ''), MAX(line_name), COUNT(*), " \
+                "SUM(realtime_first_appeared IS NOT NULL), SUM(realtime_cancelled > 0), SUM(realtime_num_cancelled_stops > 0), SUM(realtime_num_added_stops > 0) " \
+                "FROM monitored_trip WHERE operation_day IS NOT NULL GROUP BY operation_day, COALESCE(line_id, '')",
+            "CREATE TRIGGER monitored_trip_summary_insert AFTER INSERT ON monitored_trip WHEN NEW.operation_day IS NOT NULL BEGIN " \
+                "INSERT INTO line_summary (operation_day, line_id, line_name, num_trips, num_realtime, num_cancelled, num_cancelled_stops, num_added_stops) " \
+                "VALUES (NEW.operation_day, COALESCE(NEW.line_id, ''), NEW.line_name, 1, " \
+                "NEW.realtime_first_appeared IS NOT NULL, NEW.realtime_cancelled > 0, NEW.realtime_num_cancelled_stops > 0, NEW.realtime_num_added_stops > 0) " \
+                "ON CONFLICT (operation_day, line_id) DO UPDATE SET " \
+                "line_name = COALESCE(excluded.line_name, line_name), " \
+                "num_trips = num_trips + 1, " \
+                "num_realtime = num_realtime + excluded.num_realtime, " \
+                "num_cancelled = num_cancelled + excluded.num_cancelled, " \
+                "num_cancelled_stops = num_cancelled_stops + excluded.num_cancelled_stops, " \
+                "num_added_stops = num_added_stops + excluded.num_added_stops; " \
+            "END",
+            "CREATE TRIGGER monitored_trip_summary_update " \
+                "AFTER UPDATE OF realtime_first_appeared, realtime_cancelled, realtime_num_cancelled_stops, realtime_num_added_stops ON monitored_trip " \
+                "WHEN NEW.operation_day IS NOT NULL BEGIN " \
+                "UPDATE line_summary SET " \
+                "num_realtime = num_realtime + (NEW.realtime_first_appeared IS NOT NULL) - (OLD.realtime_first_appeared IS NOT NULL), " \
+                "num_cancelled = num_cancelled + (NEW.realtime_cancelled > 0) - (OLD.realtime_cancelled > 0), " \
+                "num_cancelled_stops = num_cancelled_stops + (NEW.realtime_num_cancelled_stops > 0) - (OLD.realtime_num_cancelled_stops > 0), " \
+                "num_added_stops = num_added_stops + (NEW.realtime_num_added_stops > 0) - (OLD.realtime_num_added_stops > 0) " \
+                "WHERE operation_day = NEW.operation_day AND line_id = COALESCE(NEW.line_id, ''); " \
+            "END"
+        ],
+        [
+            # optional log of the latest estimated time per call, times are seconds since epoch
+            "CREATE TABLE call_delay (" \
+                "operation_day TEXT NOT NULL, " \
+                "trip_id TEXT NOT NULL, " \
+                "stop_seq INTEGER NOT NULL, " \
+                "stop_id TEXT, " \
+                "timetabled_time INTEGER NOT NULL, " \
+                "estimated_time INTEGER NOT NULL, " \
+                "observed_at INTEGER NOT NULL, " \
+                "PRIMARY KEY (operation_day, trip_id, stop_seq)" \
+            ") WITHOUT ROWID"
+        ],
+        [
+            # state of each station between two runs of the observer with --once, the due time
+            # is in seconds since epoch and the number of results is the estimate of the result window
+            "CREATE TABLE station_state (" \
+                "station_id TEXT NOT NULL PRIMARY KEY, " \
+                "due REAL NOT NULL, " \
+                "num_results REAL" \
+            ") WITHOUT ROWID"
+        ],
+        [
+            # operation days of each shard which have been merged completely, only later days are merged again,
+            # shards are identified by the name of their database file
+            "CREATE TABLE shard_merge (" \
+                "shard TEXT NOT NULL PRIMARY KEY, " \
+                "since_day TEXT NOT NULL" \
+            ") WITHOUT ROWID"
+        ]
+    ]
+
+    # optional conversion into the compact layout, lines and stops are stored in dimension tables,
+    # operation days as days and timestamps as seconds since epoch, monitored_trip becomes a view
+    # with the documented layout which is writable by triggers
+    _compact_migration = [
+        "CREATE TABLE line (id INTEGER PRIMARY KEY, line_id TEXT, line_name TEXT)",
+        "CREATE UNIQUE INDEX line_line_id_line_name ON line (line_id, line_name)",
+        "CREATE TABLE stop (id INTEGER PRIMARY KEY, stop_id TEXT, name TEXT)",
+        "CREATE UNIQUE INDEX stop_stop_id_name ON stop (stop_id, name)",
+        "CREATE TABLE trip (" \
+            "id INTEGER PRIMARY KEY, " \
+            "operation_day INTEGER, " \
+            "trip_id TEXT, " \
+            "line INTEGER REFERENCES line (id), " \
+            "origin INTEGER REFERENCES stop (id), " \
+            "destination INTEGER REFERENCES stop (id), " \
+            "start_time INTEGER, " \
+            "end_time INTEGER, " \
+            "realtime_ref_station INTEGER REFERENCES stop (id), " \
+            "realtime_first_appeared INTEGER, " \
+            "realtime_cancelled INTEGER NOT NULL DEFAULT 0, " \
+            "realtime_num_cancelled_stops INTEGER NOT NULL DEFAULT 0, " \
+            "realtime_num_added_stops INTEGER NOT NULL DEFAULT 0" \
+        ")",
+
+        # copy all trips keeping their IDs
+        "INSERT INTO line (line_id, line_name) SELECT DISTINCT line_id, line_name FROM monitored_trip",
+        "INSERT INTO stop (stop_id, name) " \
+            "SELECT origin_stop_id, origin_name FROM monitored_trip UNION " \
+            "SELECT destination_stop_id, destination_name FROM monitored_trip UNION " \
+            "SELECT realtime_ref_station, NULL FROM monitored_trip",
+        "INSERT INTO trip (id, operation_day, trip_id, line, origin, destination, start_time, end_time, " \
+            "realtime_ref_station, realtime_first_appeared, realtime_cancelled, realtime_num_cancelled_stops, realtime_num_added_stops) " \
+            "SELECT m.id, CAST(strftime('%s', m.operation_day) AS INTEGER) / 86400, m.trip_id, l.id, o.id, d.id, " \
+            "CAST(strftime('%s', m.start_time) AS INTEGER), CAST(strftime('%s', m.end_time) AS INTEGER), r.id, " \
+            "CAST(strftime('%s', m.realtime_first_appeared) AS INTEGER), m.realtime_cancelled, m.realtime_num_cancelled_stops, m.realtime_num_added_stops " \
+            "FROM monitored_trip m " \
+            "JOIN line l ON l.line_id IS m.line_id AND l.line_name IS m.line_name " \
+            "JOIN stop o ON o.stop_id IS m.origin_stop_id AND o.name IS m.origin_name " \
+            "JOIN stop d ON d.stop_id IS m.destination_stop_id AND d.name IS m.destination_name " \
+            "JOIN stop r ON r.stop_id IS m.realtime_ref_station AND r.name IS NULL",
+        "DROP TABLE monitored_trip",
+
+        # the worker looks up trips by trip_id through the view, where the operation day is computed
+        "CREATE UNIQUE INDEX trip_operation_day_trip_id ON trip (operation_day, trip_id)",
+        "CREATE INDEX trip_trip_id ON trip (trip_id)",
+        "CREATE INDEX trip_line_operation_day ON trip (line, operation_day)",
+
+        # compatibility view, all timestamps are returned in UTC
+        "CREATE VIEW monitored_trip AS SELECT " \
+            "t.id AS id, " \
+            "date(t.operation_day * 86400, 'unixepoch') AS operation_day, " \
+            "t.trip_id AS trip_id, " \
+            "l.line_id AS line_id, " \
+            "l.line_name AS line_name, " \
+            "o.stop_id AS origin_stop_id, " \
+            "o.name AS origin_name, " \
+            "d.stop_id AS destination_stop_id, " \
+            "d.name AS destination_name, " \
+            "strftime('%Y-%m-%dT%H:%M:%S+00:00', t.start_time, 'unixepoch') AS start_time, " \
+            "strftime('%Y-%m-%dT%H:%M:%S+00:00', t.end_time, 'unixepoch') AS end_time, " \
+            "r.stop_id AS realtime_ref_station, " \
+            "strftime('%Y-%m-%dT%H:%M:%S+00:00', t.realtime_first_appeared, 'unixepoch') AS realtime_first_appeared, " \
+            "t.realtime_cancelled AS realtime_cancelled, " \
+            "t.realtime_num_cancelled_stops AS realtime_num_cancelled_stops, " \
+            "t.realtime_num_added_stops AS realtime_num_added_stops " \
+            "FROM trip t " \
+            "LEFT JOIN line l ON l.id = t.line " \
+            "LEFT JOIN stop o ON o.id = t.origin " \
+            "LEFT JOIN stop d ON d.id = t.destination " \
+            "LEFT JOIN stop r ON r.id = t.realtime_ref_station",
+        "CREATE TRIGGER monitored_trip_insert INSTEAD OF INSERT ON monitored_trip BEGIN " \
+            "SELECT RAISE(ABORT, 'invalid date or timestamp') WHERE " \
+            "(NEW.operation_day IS NOT NULL AND strftime('%s', NEW.operation_day) IS NULL) OR " \
+            "(NEW.start_time IS NOT NULL AND strftime('%s', NEW.start_time) IS NULL) OR " \
+            "(NEW.end_time IS NOT NULL AND strftime('%s', NEW.end_time) IS NULL) OR " \
+            "(NEW.realtime_first_appeared IS NOT NULL AND strftime('%s', NEW.realtime_first_appeared) IS NULL); " \
+            "INSERT INTO line (line_id, line_name) SELECT NEW.line_id, NEW.line_name " \
+            "WHERE NOT EXISTS (SELECT 1 FROM line WHERE line_id IS NEW.line_id AND line_name IS NEW.line_name); " \
+            "INSERT INTO stop (stop_id, name) SELECT NEW.origin_stop_id, NEW.origin_name " \
+            "WHERE NOT EXISTS (SELECT 1 FROM stop WHERE stop_id IS NEW.origin_stop_id AND name IS NEW.origin_name); " \
+            "INSERT INTO stop (stop_id, name) SELECT NEW.destination_stop_id, NEW.destination_name " \
+            "WHERE NOT EXISTS (SELECT 1 FROM stop WHERE stop_id IS NEW.destination_stop_id AND name IS NEW.destination_name); " \
+            "INSERT INTO stop (stop_id, name) SELECT NEW.realtime_ref_station, NULL " \
+            "WHERE NOT EXISTS (SELECT 1 FROM stop WHERE stop_id IS NEW.realtime_ref_station AND name IS NULL); " \
+            "INSERT INTO trip (id, operation_day, trip_id, line, origin, destination, start_time, end_time, " \
+            "realtime_ref_station, realtime_first_appeared, realtime_cancelled, realtime_num_cancelled_stops, realtime_num_added_stops) VALUES (" \
+            "NEW.id, CAST(strftime('%s', NEW.operation_day) AS INTEGER) / 86400, NEW.trip_id, " \
+            "(SELECT id FROM line WHERE line_id IS NEW.line_id AND line_name IS NEW.line_name), " \
+            "(SELECT id FROM stop WHERE stop_id IS NEW.origin_stop_id AND name IS NEW.origin_name), " \
+            "(SELECT id FROM stop WHERE stop_id IS NEW.destination_stop_id AND name IS NEW.destination_name), " \
+            "CAST(strftime('%s', NEW.start_time) AS INTEGER), CAST(strftime('%s', NEW.end_time) AS INTEGER), " \
+            "(SELECT id FROM stop WHERE stop_id IS NEW.realtime_ref_station AND name IS NULL), " \
+            "CAST(strftime('%s', NEW.realtime_first_appeared) AS INTEGER), " \
+            "COALESCE(NEW.realtime_cancelled, 0), COALESCE(NEW.realtime_num_cancelled_stops, 0), COALESCE(NEW.realtime_num_added_stops, 0)); " \
+        "END",
+        "CREATE TRIGGER monitored_trip_update INSTEAD OF UPDATE ON monitored_trip BEGIN " \
+            "SELECT RAISE(ABORT, 'invalid date or timestamp') WHERE " \
+            "(NEW.operation_day IS NOT NULL AND strftime('%s', NEW.operation_day) IS NULL) OR " \
+            "(NEW.start_time IS NOT NULL AND strftime('%s', NEW.start_time) IS NULL) OR " \
+            "(NEW.end_time IS NOT NULL AND strftime('%s', NEW.end_time) IS NULL) OR " \
+            "(NEW.realtime_first_appeared IS NOT NULL AND strftime('%s', NEW.realtime_first_appeared) IS NULL); " \
+            "INSERT INTO line (line_id, line_name) SELECT NEW.line_id, NEW.line_name " \
+            "WHERE NOT EXISTS (SELECT 1 FROM line WHERE line_id IS NEW.line_id AND line_name IS NEW.line_name); " \
+            "INSERT INTO stop (stop_id, name) SELECT NEW.origin_stop_id, NEW.origin_name " \
+            "WHERE NOT EXISTS (SELECT 1 FROM stop WHERE stop_id IS NEW.origin_stop_id AND name IS NEW.origin_name); " \
+            "INSERT INTO stop (stop_id, name) SELECT NEW.destination_stop_id, NEW.destination_name " \
+            "WHERE NOT EXISTS (SELECT 1 FROM stop WHERE stop_id IS NEW.destination_stop_id AND name IS NEW.destination_name); " \
+            "INSERT INTO stop (stop_id, name) SELECT NEW.realtime_ref_station, NULL " \
+            "WHERE NOT EXISTS (SELECT 1 FROM stop WHERE stop_id IS NEW.realtime_ref_station AND name IS NULL); " \
+            "UPDATE trip SET " \
+            "id = NEW.id, " \
+            "operation_day = CAST(strftime('%s', NEW.operation_day) AS INTEGER) / 86400, " \
+            "trip_id = NEW.trip_id, " \
+            "line = (SELECT id FROM line WHERE line_id IS NEW.line_id AND line_name IS NEW.line_name), " \
+            "origin = (SELECT id FROM stop WHERE stop_id IS NEW.origin_stop_id AND name IS NEW.origin_name), " \
+            "destination = (SELECT id FROM stop WHERE stop_id IS NEW.destination_stop_id AND name IS NEW.destination_name), " \
+            "start_time = CAST(strftime('%s', NEW.start_time) AS INTEGER), " \
+            "end_time = CAST(strftime('%s', NEW.end_time) AS INTEGER), " \
+            "realtime_ref_station = (SELECT id FROM stop WHERE stop_id IS NEW.realtime_ref_station AND name IS NULL), " \
+            "realtime_first_appeared = CAST(strftime('%s', NEW.realtime_first_appeared) AS INTEGER), " \
+            "realtime_cancelled = NEW.realtime_cancelled, " \
+            "realtime_num_cancelled_stops = NEW.realtime_num_cancelled_stops, " \
+            "realtime_num_added_stops = NEW.realtime_num_added_stops " \
+            "WHERE id = OLD.id; " \
+        "END",
+        "CREATE TRIGGER monitored_trip_delete INSTEAD OF DELETE ON monitored_trip BEGIN " \
+            "DELETE FROM trip WHERE id = OLD.id; " \
+        "END",
+
+        # daily summaries are maintained by triggers on the trip table from now on
+        "CREATE TRIGGER trip_summary_insert AFTER INSERT ON trip WHEN NEW.operation_day IS NOT NULL BEGIN " \
+            "INSERT INTO line_summary (operation_day, line_id, line_name, num_trips, num_realtime, num_cancelled, num_cancelled_stops, num_added_stops) " \
+            "SELECT date(NEW.operation_day * 86400, 'unixepoch'), COALESCE(l.line_id, ''), l.line_name, 1, " \
+            "NEW.realtime_first_appeared IS NOT NULL, NEW.realtime_cancelled > 0, NEW.realtime_num_cancelled_stops > 0, NEW.realtime_num_added_stops > 0 " \
+            "FROM line l WHERE l.id = NEW.line " \
+            "ON CONFLICT (operation_day, line_id) DO UPDATE SET " \
+            "line_name = COALESCE(excluded.line_name, line_name), " \
+            "num_trips = num_trips + 1, " \
+            "num_realtime = num_realtime + excluded.num_realtime, " \
+            "num_cancelled = num_cancelled + excluded.num_cancelled, " \
+            "num_cancelled_stops = num_cancelled_stops + excluded.num_cancelled_stops, " \
+            "num_added_stops = num_added_stops + excluded.num_added_stops; " \
+        "END",
+        "CREATE TRIGGER trip_summary_update " \
+            "AFTER UPDATE OF realtime_first_appeared, realtime_cancelled, realtime_num_cancelled_stops, realtime_num_added_stops ON trip " \
+            "WHEN NEW.operation_day IS NOT NULL BEGIN " \
+            "UPDATE line_summary SET " \
+            "num_realtime = num_realtime + (NEW.realtime_first_appeared IS NOT NULL) - (OLD.realtime_first_appeared IS NOT NULL), " \
+            "num_cancelled = num_cancelled + (NEW.realtime_cancelled > 0) - (OLD.realtime_cancelled > 0), " \
+            "num_cancelled_stops = num_cancelled_stops + (NEW.realtime_num_cancelled_stops > 0) - (OLD.realtime_num_cancelled_stops > 0), " \
+            "num_added_stops = num_added_stops + (NEW.realtime_num_added_stops > 0) - (OLD.realtime_num_added_stops > 0) " \
+            "WHERE operation_day = date(NEW.operation_day * 86400, 'unixepoch') AND line_id = (SELECT COALESCE(line_id, '') FROM line WHERE id = NEW.line); " \
+        "END"
+    ]
+
+    @classmethod
+    def version(cls, connection=None) -> int:
+        connection = connection if connection is not None else sqlhub.processConnection
+
+        if not connection.tableExists('schema_version'):
+            return 0
+
+        return connection.queryOne('SELECT MAX(version) FROM schema_version')[0] or 0
+
+    @classmethod
+    def latest_version(cls) -> int:
+        return len(cls._migrations)
+
+    @classmethod
+    def upgrade(cls, connection=None) -> int:
+        connection = connection if connection is not None else sqlhub.processConnection
+
+        # the trips table is replaced by a view in the compact layout
+        if not cls.is_compact(connection):
+            MonitoredTrip.createTable(ifNotExists=True, connection=connection)
+
+        connection.query('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL, applied TEXT NOT NULL)')
+
+        version = cls.version(connection)
+        for migration_version in range(version + 1, cls.latest_version() + 1):
+            logging.info(f"Migrating database schema to version {migration_version} ...")
+
+            cls._apply(connection, cls._migrations[migration_version - 1], migration_version)
+
+        return cls.version(connection)
+
+    @classmethod
+    def is_compact(cls, connection=None) -> bool:
+        connection = connection if connection is not None else sqlhub.processConnection
+
+        return connection.queryOne("SELECT COUNT(*) FROM sqlite_master WHERE type = 'view' AND name = 'monitored_trip'")[0] > 0
+
+    @classmethod
+    def compact(cls, connection=None) -> bool:
+        connection = connection if connection is not None else sqlhub.processConnection
+
+        if cls.is_compact(connection):
+            return False
+
+        cls.upgrade(connection)
+
+        # dates and timestamps which can't be converted would be lost
+        num_invalid = connection.queryOne(
+            "SELECT COUNT(*) FROM monitored_trip WHERE " \
+            "(operation_day IS NOT NULL AND strftime('%s', operation_day) IS NULL) OR " \
+            "(start_time IS NOT NULL AND strftime('%s', start_time) IS NULL) OR " \
+            "(end_time IS NOT NULL AND strftime('%s', end_time) IS NULL) OR " \
+            "(realtime_first_appeared IS NOT NULL AND strftime('%s', realtime_first_appeared) IS NULL)"
+        )[0]
+
+        if num_invalid > 0:
+            raise ValueError(f"{num_invalid} monitored trips contain dates or timestamps which can't be converted")
+
+        logging.info('Converting database into the compact layout ...')
+        cls._apply(connection, cls._compact_migration)
+
+        # free the space of the former table
+        connection.query('VACUUM')
+
+        return True
+
+    @classmethod
+    def _apply(cls, connection, statements: list, version: int|None = None) -> None:
+        # all statements are executed within one transaction
+        raw_connection = connection.getConnection()
+        try:
+            raw_connection.execute('BEGIN')
+
+            for statement in statements:
+                raw_connection.execute(statement)
+
+            if version is not None:
+                raw_connection.execute("INSERT INTO schema_version (version, applied) VALUES (?, datetime('now'))", (version,))
+
+            raw_connection.execute('COMMIT')
+        except Exception:
+            if raw_connection.in_transaction:
+                raw_connection.execute('ROLLBACK')
+
+            raise
+        finally:
+            connection.releaseConnection(raw_connection)
+
+    @classmethod
+    def configure(cls, connection=None) -> None:
+        connection = connection if connection is not None else sqlhub.processConnection
+
+        # WAL is stored persistently in the database file, all other pragmas apply
+        # to the connection of the current thread which is kept by SQLObject
+        connection.query('PRAGMA journal_mode = WAL')
+        connection.query('PRAGMA synchronous = NORMAL')
+        connection.query('PRAGMA temp_store = MEMORY')
+        connection.query('PRAGMA cache_size = -16000')
+        connection.query('PRAGMA busy_timeout = 10000')
@@ -0,0 +1,236 @@
+import datetime
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+import zlib
+
+from sqlobject import sqlhub
+from typing import Dict
+from typing import Tuple
+
+from ticktrack.archive import Archive
+
+def shard_of(station_id: str, num_shards: int) -> int:
+    # stable across processes and Python versions unlike hash()
+    return zlib.crc32(station_id.encode('utf-8')) % num_shards + 1
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    index, num_shards = [int(v) for v in value.split('/')]
+    if num_shards < 1 or index < 1 or index > num_shards:
+        raise ValueError(f"invalid shard {value}, expected i/N with 1 <= i <= N")
+
+    return (index, num_shards)
+
+def shard_path(path: str, index: int, num_shards: int) -> str:
+    name, extension = os.path.splitext(path)
+
+    return f"{name}.shard-{index}-of-{num_shards}{extension}"
+
+class ShardMerger:
+
+    def __init__(self, connection=None, chunk_size: int = 5000) -> None:
+        self._connection = connection if connection is not None else sqlhub.processConnection
+        self._chunk_size = chunk_size
+
+    def merge(self, filename: str, min_day: str|None = None, prune: bool = False) -> Tuple[int, str|None]:
+        # trips are read in chunks from the attached shard and written through monitored_trip,
+        # so this works for the compact layout as well
+        shard = os.path.basename(filename)
+
+        connection = self._connection.getConnection()
+        connection.execute('ATTACH DATABASE ? AS shard', (filename,))
+        try:
+            max_day = connection.execute('SELECT MAX(operation_day) FROM shard.monitored_trip').fetchone()[0]
+
+            connection.execute('BEGIN')
+
+            # days which have been merged completely before are skipped as well as days before min_day,
+            # e.g. as they have been archived already, merging them again would count their trips twice
+            row = connection.execute('SELECT since_day FROM main.shard_merge WHERE shard = ?', (shard,)).fetchone()
+            since_day = row[0] if row is not None else ''
+            if min_day is not None and min_day > since_day:
+                since_day = min_day
+
+            cursor = connection.execute(
+                "SELECT operation_day, trip_id, line_id, line_name, origin_stop_id, origin_name, destination_stop_id, destination_name, start_time, end_time, " \
+                "realtime_ref_station, realtime_first_appeared, realtime_cancelled, realtime_num_cancelled_stops, realtime_num_added_stops " \
+                "FROM shard.monitored_trip WHERE operation_day IS NOT NULL AND operation_day >= ?",
+                (since_day,)
+            )
+
+            num_trips = 0
+            while True:
+                rows = cursor.fetchmany(self._chunk_size)
+                if len(rows) == 0:
+                    break
+
+                # insert trips which are unknown yet, all others are merged afterwards
+                connection.executemany(
+                    "INSERT INTO main.monitored_trip (operation_day, trip_id, line_id, line_name, origin_stop_id, origin_name, destination_stop_id, destination_name, start_time, end_time, " \
+                    "realtime_ref_station, realtime_first_appeared, realtime_cancelled, realtime_num_cancelled_stops, realtime_num_added_stops) " \
+                    "SELECT ?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8, ?9, ?10, ?11, ?12, ?13, ?14, ?15 " \
+                    "WHERE NOT EXISTS (SELECT 1 FROM main.monitored_trip WHERE operation_day = ?1 AND trip_id = ?2)",
+                    rows
+                )
+
+                # realtime appeared first at the earliest time any shard has seen it, all timestamps are in UTC
+                # and can be compared as strings, cancellations and changed stops are the max. of all shards
+                connection.executemany(
+                    "UPDATE main.monitored_trip SET " \
+                    "realtime_first_appeared = CASE WHEN realtime_first_appeared IS NULL OR realtime_first_appeared > ?3 THEN ?3 ELSE realtime_first_appeared END, " \
+                    "realtime_cancelled = MAX(realtime_cancelled, ?4), " \
+                    "realtime_num_cancelled_stops = MAX(realtime_num_cancelled_stops, ?5), " \
+                    "realtime_num_added_stops = MAX(realtime_num_added_stops, ?6) " \
+                    "WHERE operation_day = ?1 AND trip_id = ?2 AND (" \
+                    "(?3 IS NOT NULL AND (realtime_first_appeared IS NULL OR realtime_first_appeared > ?3)) OR " \
+                    "realtime_cancelled < ?4 OR realtime_num_cancelled_stops < ?5 OR realtime_num_added_stops < ?6)",
+                    [(r[0], r[1], r[11], r[12], r[13], r[14]) for r in rows]
+                )
+
+                num_trips = num_trips + len(rows)
+
+            # the latest estimate of each call wins, shards of older versions have no delays
+            if connection.execute("SELECT COUNT(*) FROM shard.sqlite_master WHERE type = 'table' AND name = 'call_delay'").fetchone()[0] > 0:
+                connection.execute(
+                    "INSERT INTO main.call_delay (operation_day, trip_id, stop_seq, stop_id, timetabled_time, estimated_time, observed_at) " \
+                    "SELECT operation_day, trip_id, stop_seq, stop_id, timetabled_time, estimated_time, observed_at FROM shard.call_delay WHERE operation_day >= ? " \
+                    "ON CONFLICT (operation_day, trip_id, stop_seq) DO UPDATE SET " \
+                    "stop_id = excluded.stop_id, timetabled_time = excluded.timetabled_time, estimated_time = excluded.estimated_time, observed_at = excluded.observed_at " \
+                    "WHERE excluded.observed_at > observed_at",
+                    (since_day,)
+                )
+
+            # only the last two operation days can still change after they have been merged
+            if max_day is not None:
+                since_day = max(since_day, (datetime.date.fromisoformat(max_day) - datetime.timedelta(days=1)).isoformat())
+
+                connection.execute(
+                    "INSERT INTO main.shard_merge (shard, since_day) VALUES (?, ?) " \
+                    "ON CONFLICT (shard) DO UPDATE SET since_day = MAX(since_day, excluded.since_day)",
+                    (shard, since_day)
+                )
+
+            connection.execute('COMMIT')
+
+            # days which have been merged completely are removed from the shard in order to keep it small
+            if prune:
+                self._prune(connection, since_day)
+        except Exception:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+
+            raise
+        finally:
+            connection.execute('DETACH DATABASE shard')
+            self._connection.releaseConnection(connection)
+
+        return (num_trips, max_day)
+
+    def _prune(self, connection, since_day: str) -> None:
+        connection.execute('BEGIN')
+
+        connection.execute('DELETE FROM shard.monitored_trip WHERE operation_day < ?', (since_day,))
+        if connection.execute("SELECT COUNT(*) FROM shard.sqlite_master WHERE type = 'table' AND name = 'call_delay'").fetchone()[0] > 0:
+            connection.execute('DELETE FROM shard.call_delay WHERE operation_day < ?', (since_day,))
+
+        connection.execute('COMMIT')
+
+class ShardSupervisor:
+
+    def __init__(self, database: str, config: str, num_shards: int, merge_interval: float = 300, archive: Archive|None = None, connection=None) -> None:
+        self._database = database
+        self._config = config
+        self._num_shards = num_shards
+        self._merge_interval = merge_interval
+        self._archive = archive
+        self._merger = ShardMerger(connection)
+
+        self._processes: Dict[int, subprocess.Popen] = dict()
+        self._signal = signal.SIGTERM
+
+    def run(self) -> None:
+        # the signal stopping the supervisor is forwarded to all shards
+        handlers = {s: signal.signal(s, self._terminate) for s in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            while True:
+                for index in range(1, self._num_shards + 1):
+                    self._start(index)
+
+                time.sleep(self._merge_interval)
+
+                self.merge()
+                self._archive_days()
+        except SystemExit:
+            logging.info('Stopping all shards ...')
+        finally:
+            # further signals must not interrupt waiting for the shards
+            for signum in handlers.keys():
+                signal.signal(signum, signal.SIG_IGN)
+
+            self.stop(self._signal)
+
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+
+    def merge(self) -> None:
+        for index in range(1, self._num_shards + 1):
+            filename = shard_path(self._database, index, self._num_shards)
+            if not os.path.exists(filename):
+                continue
+
+            # archived days must not be merged again, merged days are removed from the shards
+            try:
+                num_trips, _ = self._merger.merge(filename, self._archive.boundary() if self._archive is not None else None, True)
+
+                logging.info(f"Merged {num_trips} monitored trips of shard {index}/{self._num_shards}")
+            except Exception as ex:
+                logging.error(ex)
+
+    def _archive_days(self) -> None:
+        if self._archive is None:
+            return
+
+        # finished operation days are moved out of the merged database once a day
+        try:
+            num_days, num_trips = self._archive.run()
+            if num_days > 0:
+                logging.info(f"Archived {num_trips} monitored trips of {num_days} operation days")
+        except Exception as ex:
+            logging.error(ex)
+
+    def stop(self, signum: int = signal.SIGTERM, timeout: float = 30) -> None:
+        for process in self._processes.values():
+            if process.poll() is None:
+                process.send_signal(signum)
+
+        # shards which don't exit in time are killed
+        for index, process in self._processes.items():
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                logging.warning(f"Shard {index}/{self._num_shards} did not exit within {timeout}s, killing ...")
+
+                process.kill()
+                process.wait()
+
+        self._processes.clear()
+
+    def _terminate(self, signum: int, frame) -> None:
+        self._signal = signum
+
+        raise SystemExit()
+
+    def _start(self, index: int) -> None:
+        process = self._processes.get(index)
+        if process is not None and process.poll() is None:
+            return
+
+        if process is not None:
+            logging.warning(f"Shard {index}/{self._num_shards} exited with code {process.returncode}, restarting ...")
+
+        self._processes[index] = subprocess.Popen(
+            [sys.executable, '-m', 'ticktrack', 'observe', self._database, self._config, '--shard', f"{index}/{self._num_shards}"]
+        )
@@ -0,0 +1,52 @@
+from sqlobject import sqlhub
+from typing import List
+
+from ticktrack.scheduler import StationScheduler
+from ticktrack.window import ResultWindow
+
+class StationState:
+
+    def __init__(self, connection=None) -> None:
+        self._connection = connection if connection is not None else sqlhub.processConnection
+
+    def load(self, station_ids: List[str], scheduler: StationScheduler, window: ResultWindow) -> int:
+        connection = self._connection.getConnection()
+        try:
+            rows = {r[0]: r for r in connection.execute('SELECT station_id, due, num_results FROM station_state').fetchall()}
+        finally:
+            self._connection.releaseConnection(connection)
+
+        # stations without a state of the last run are due immediately
+        num_restored = 0
+        for station_id in station_ids:
+            row = rows.get(station_id)
+            if row is None:
+                scheduler.add(station_id)
+                continue
+
+            scheduler.add(station_id, row[1])
+            if row[2] is not None:
+                window.restore(station_id, row[2])
+
+            num_restored = num_restored + 1
+
+        return num_restored
+
+    def save(self, station_ids: List[str], scheduler: StationScheduler, window: ResultWindow) -> None:
+        # the whole state is replaced, so stations which are not configured anymore are removed
+        connection = self._connection.getConnection()
+        try:
+            connection.execute('BEGIN')
+            connection.execute('DELETE FROM station_state')
+            connection.executemany(
+                'INSERT INTO station_state (station_id, due, num_results) VALUES (?, ?, ?)',
+                [(s, scheduler.due(s), window.estimate(s)) for s in dict.fromkeys(station_ids) if scheduler.due(s) is not None]
+            )
+            connection.execute('COMMIT')
+        except Exception:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+
+            raise
+        finally:
+            self._connection.releaseConnection(connection)
@@ -0,0 +1,293 @@
+import datetime
+import logging
+import sqlite3
+
+from collections import OrderedDict
+from sqlobject import sqlhub
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+from ticktrack.delaylog import DelayLog
+from ticktrack.model import MonitoredTrip
+from ticktrack.parser import StopEventRecord
+
+class _Trip:
+    __slots__ = (
+        'operation_day',
+        'trip_id',
+        'record',
+        'realtime_ref_station',
+        'realtime_first_appeared',
+        'realtime_cancelled',
+        'realtime_num_cancelled_stops',
+        'realtime_num_added_stops',
+        'persisted'
+    )
+
+    def __init__(self, operation_day: str, trip_id: str) -> None:
+        self.operation_day = operation_day
+        self.trip_id = trip_id
+        self.record = None
+        self.realtime_ref_station = None
+        self.realtime_first_appeared = None
+        self.realtime_cancelled = 0
+        self.realtime_num_cancelled_stops = 0
+        self.realtime_num_added_stops = 0
+        self.persisted = True
+
+class TripStore:
+
+    def __init__(self, connection=None, max_size: int = 100000, delay_log: DelayLog|None = None) -> None:
+        self._connection = connection if connection is not None else sqlhub.processConnection
+        self._max_size = max_size
+        self._delay_log = delay_log
+        self._table = MonitoredTrip.sqlmeta.table
+
+        # known trips of the current operation days and trips which need to be written
+        # with the next flush, both are keyed by (operation_day, trip_id)
+        self._trips: OrderedDict[Tuple[str, str], _Trip] = OrderedDict()
+        self._pending: Dict[Tuple[str, str], _Trip] = dict()
+
+        self._current_day = None
+        self._eviction_day = None
+
+    def observe(self, station_id: str, records: List[StopEventRecord], timestamp: str) -> None:
+        if self._delay_log is not None:
+            self._delay_log.observe(records, timestamp)
+
+        # load all trips which are not known yet with one query per operation day
+        self._load([(r.operation_day, r.trip_id) for r in records if (r.operation_day, r.trip_id) not in self._trips])
+
+        for record in records:
+            key = (record.operation_day, record.trip_id)
+
+            if record.operation_day is not None and (self._current_day is None or record.operation_day > self._current_day):
+                self._current_day = record.operation_day
+
+            trip = self._trips.get(key)
+            if trip is None:
+
+                # remember a new monitored trip for this operation day
+                trip = _Trip(record.operation_day, record.trip_id)
+                trip.record = record
+                trip.realtime_ref_station = station_id
+                trip.realtime_first_appeared = timestamp if record.realtime else None
+                trip.realtime_cancelled = record.cancelled
+                trip.realtime_num_cancelled_stops = record.num_cancelled_stops
+                trip.realtime_num_added_stops = record.num_added_stops
+                trip.persisted = False
+
+                self._trips[key] = trip
+                self._pending[key] = trip
+
+                continue
+
+            self._trips.move_to_end(key)
+
+            # only update the trip if there's no realtime available yet
+            if trip.realtime_first_appeared is None and record.realtime:
+                trip.realtime_first_appeared = timestamp
+                self._pending[key] = trip
+
+            # update realtime metrics if there's something special
+            if record.cancelled > trip.realtime_cancelled \
+                or record.num_cancelled_stops > trip.realtime_num_cancelled_stops \
+                or record.num_added_stops > trip.realtime_num_added_stops:
+
+                trip.realtime_cancelled = record.cancelled
+                trip.realtime_num_cancelled_stops = record.num_cancelled_stops
+                trip.realtime_num_added_stops = record.num_added_stops
+                self._pending[key] = trip
+
+    def has_realtime(self, operation_day: str, trip_id: str) -> bool:
+        trip = self._trips.get((operation_day, trip_id))
+        
+        return trip is not None and trip.realtime_first_appeared is not None
+
+    def flush(self) -> Tuple[int, int]:
+        inserts = [t for t in self._pending.values() if not t.persisted]
+        updates = [t for t in self._pending.values() if t.persisted]
+
+        # delays of all calls are written within the same transaction
+        delays = self._delay_log is not None and len(self._delay_log) > 0
+
+        if len(inserts) > 0 or len(updates) > 0 or delays:
+            connection = self._connection.getConnection()
+            try:
+                try:
+                    self._write(connection, inserts, updates, delays)
+                except (sqlite3.IntegrityError, ValueError) as ex:
+                    # single trips which can't be written, e.g. as another writer has inserted them
+                    # meanwhile, must not block all others, so the trips are written one by one then
+                    logging.error(ex)
+
+                    inserts, updates = self._write_each(connection, inserts, updates, delays)
+            except Exception as ex:
+                # pending changes are kept and written with the next flush
+                logging.error(ex)
+
+                self._evict()
+
+                return (0, 0)
+            finally:
+                self._connection.releaseConnection(connection)
+
+            for trip in inserts:
+                trip.record = None
+                trip.persisted = True
+
+            self._pending.clear()
+
+            if self._delay_log is not None:
+                self._delay_log.clear()
+
+        self._evict()
+
+        return (len(inserts), len(updates))
+
+    def _write(self, connection, inserts: List[_Trip], updates: List[_Trip], delays: bool) -> None:
+        try:
+            connection.execute('BEGIN')
+
+            connection.executemany(
+                f"INSERT INTO {self._table} (operation_day, trip_id, line_id, line_name, origin_stop_id, origin_name, destination_stop_id, destination_name, start_time, end_time, " \
+                "realtime_ref_station, realtime_first_appeared, realtime_cancelled, realtime_num_cancelled_stops, realtime_num_added_stops) " \
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(
+                    t.operation_day,
+                    t.trip_id,
+                    t.record.line_id,
+                    t.record.line_name,
+                    t.record.origin_stop_id,
+                    t.record.origin_name,
+                    t.record.destination_stop_id,
+                    t.record.destination_name,
+                    t.record.start_time,
+                    t.record.end_time,
+                    t.realtime_ref_station,
+                    t.realtime_first_appeared,
+                    t.realtime_cancelled,
+                    t.realtime_num_cancelled_stops,
+                    t.realtime_num_added_stops
+                ) for t in inserts]
+            )
+
+            connection.executemany(
+                f"UPDATE {self._table} SET realtime_first_appeared = ?, realtime_cancelled = ?, realtime_num_cancelled_stops = ?, realtime_num_added_stops = ? " \
+                "WHERE operation_day = ? AND trip_id = ?",
+                [(
+                    t.realtime_first_appeared,
+                    t.realtime_cancelled,
+                    t.realtime_num_cancelled_stops,
+                    t.realtime_num_added_stops,
+                    t.operation_day,
+                    t.trip_id
+                ) for t in updates]
+            )
+
+            if delays:
+                self._delay_log.write(connection)
+
+            connection.execute('COMMIT')
+        except Exception:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+
+            raise
+
+    def _write_each(self, connection, inserts: List[_Trip], updates: List[_Trip], delays: bool) -> Tuple[List[_Trip], List[_Trip]]:
+        written_inserts = list()
+        written_updates = list()
+
+        for trip in inserts + updates:
+            try:
+                if trip.persisted:
+                    self._write(connection, [], [trip], False)
+                    written_updates.append(trip)
+                else:
+                    self._write(connection, [trip], [], False)
+                    written_inserts.append(trip)
+            except (sqlite3.IntegrityError, ValueError) as ex:
+                logging.warning(f"Monitored trip {trip.trip_id} of operation day {trip.operation_day} could not be written: {ex}")
+
+                # trips which exist already are loaded again when they're seen the next time,
+                # all others are invalid and not written again
+                exists = connection.execute(
+                    f"SELECT COUNT(*) FROM {self._table} WHERE operation_day = ? AND trip_id = ?",
+                    (trip.operation_day, trip.trip_id)
+                ).fetchone()[0] > 0
+
+                if exists:
+                    self._trips.pop((trip.operation_day, trip.trip_id), None)
+                else:
+                    trip.record = None
+                    trip.persisted = True
+
+        if delays:
+            try:
+                self._write(connection, [], [], True)
+            except (sqlite3.IntegrityError, ValueError) as ex:
+                logging.warning(f"Delays of {len(self._delay_log)} calls could not be written: {ex}")
+
+                self._delay_log.discard()
+
+        return (written_inserts, written_updates)
+
+    def _load(self, keys: List[Tuple[str, str]]) -> None:
+        if len(keys) == 0:
+            return
+
+        trip_ids_by_day = dict()
+        for operation_day, trip_id in keys:
+            trip_ids_by_day.setdefault(operation_day, set()).add(trip_id)
+
+        connection = self._connection.getConnection()
+        try:
+            for operation_day, trip_ids in trip_ids_by_day.items():
+                trip_ids = list(trip_ids)
+
+                # stay below the max. number of SQLite query parameters
+                for n in range(0, len(trip_ids), 500):
+                    chunk = trip_ids[n:n + 500]
+                    rows = connection.execute(
+                        "SELECT operation_day, trip_id, realtime_ref_station, realtime_first_appeared, realtime_cancelled, realtime_num_cancelled_stops, realtime_num_added_stops " \
+                        f"FROM {self._table} WHERE operation_day = ? AND trip_id IN ({', '.join('?' * len(chunk))})",
+                        [operation_day] + chunk
+                    ).fetchall()
+
+                    for row in rows:
+                        key = (row[0], row[1])
+                        if key in self._trips:
+                            continue
+
+                        trip = _Trip(row[0], row[1])
+                        trip.realtime_ref_station = row[2]
+                        trip.realtime_first_appeared = row[3]
+                        trip.realtime_cancelled = row[4]
+                        trip.realtime_num_cancelled_stops = row[5]
+                        trip.realtime_num_added_stops = row[6]
+
+                        self._trips[key] = trip
+        finally:
+            self._connection.releaseConnection(connection)
+
+    def _evict(self) -> None:
+        # drop all trips of finished operation days once the day rolls over, trips of
+        # the previous day are kept as they may still be running after midnight
+        # the current day is the latest operation day seen, so this works for replaying old data too
+        if self._current_day is not None and self._eviction_day != self._current_day:
+            self._eviction_day = self._current_day
+
+            try:
+                min_operation_day = (datetime.date.fromisoformat(self._current_day) - datetime.timedelta(days=1)).isoformat()
+            except ValueError:
+                min_operation_day = None
+
+            if min_operation_day is not None:
+                for key in [k for k in self._trips.keys() if k[0] is not None and k[0] < min_operation_day]:
+                    del self._trips[key]
+
+        # keep the cache bounded, the least recently seen trips are dropped first
+        while len(self._trips) > self._max_size:
+            self._trips.popitem(last=False)
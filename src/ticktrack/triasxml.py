@@ -1,56 +1,53 @@
 import re
 
-def exists(obj, path):
-    path = path.split('.')
-    
-    level0 = path[0]
-    level1 = '.'.join(path[1:])
-    
-    return obj is not None and hasattr(obj, level0) if len(path) == 1 else exists(getattr(obj, level0), level1) if hasattr(obj, level0) else False
+from functools import lru_cache
+from typing import Callable
+from typing import Tuple
 
-def get_elements(obj, path):
-    if exists(obj, path):
-        path = path.split('.')
-        
+_ATTRIBUTE_SEPARATOR = re.compile(r'\.(?![^{]*})')
+_MISSING = object()
+
+@lru_cache(maxsize=1024)
+def compile_path(path: str) -> Callable:
+    elements = tuple(path.split('.'))
+
+    # the accessor walks the path once and returns the default value as soon as
+    # one element of the path is missing
+    def accessor(obj, default=None):
         destination = obj
-        for element in path:
-            destination = getattr(destination, element)
-            
+        for element in elements:
+            destination = getattr(destination, element, _MISSING)
+            if destination is _MISSING:
+                return default
+
         return destination
 
-    return list()
-    
+    return accessor
+
+@lru_cache(maxsize=1024)
+def _compile_attribute_path(path: str) -> Tuple[Callable, str]:
+    path = _ATTRIBUTE_SEPARATOR.split(path)
+
+    return compile_path('.'.join(path[:-1])), path[-1]
+
+def exists(obj, path):
+    return compile_path(path)(obj, _MISSING) is not _MISSING
+
+def get_elements(obj, path):
+    return compile_path(path)(obj, list())
+
 def get_value(obj, path, default=None):
-    if exists(obj, path):
-        path = path.split('.')
-        
-        destination = obj
-        for element in path:
-            destination = getattr(destination, element)
-            
-        if hasattr(destination, 'text'):
-            return destination.text
-        else:
-            return default
-        
+    destination = compile_path(path)(obj, _MISSING)
+    if destination is not _MISSING and hasattr(destination, 'text'):
+        return destination.text
+
     return default
 
 def get_attribute(obj, path, default=None):
-    regex = re.compile('\.(?![^{]*})')
-    
-    objectpath = regex.split(path)
-    objectpath = '.'.join(objectpath[:-1])
-    
-    if exists(obj, objectpath):
-        path = regex.split(path)
-        
-        destination = obj
-        for element in path[:-1]:
-            destination = getattr(destination, element)
-            
-        if hasattr(destination, 'attrib') and path[-1] in destination.attrib:
-            return destination.attrib[(path[-1])]
-        else:
-            return default
-            
-    return default
\ No newline at end of file
+    accessor, attribute = _compile_attribute_path(path)
+
+    destination = accessor(obj, _MISSING)
+    if destination is not _MISSING and hasattr(destination, 'attrib') and attribute in destination.attrib:
+        return destination.attrib[attribute]
+
+    return default
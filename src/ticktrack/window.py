@@ -0,0 +1,54 @@
+import math
+
+from typing import Dict
+from typing import List
+
+class ResultWindow:
+
+    def __init__(self, coverage: float, default: int = 20, min_results: int = 5, max_results: int = 100, overrides: Dict[str, int]|None = None, adaptive: bool = True) -> None:
+        self._coverage = coverage
+        self._default = default
+        self._min_results = min_results
+        self._max_results = max_results
+        self._overrides = overrides if overrides is not None else dict()
+        self._adaptive = adaptive
+
+        # smoothed number of results required per station
+        self._estimates: Dict[str, float] = dict()
+
+    def num_results(self, station_id: str) -> int:
+        if station_id in self._overrides:
+            return int(self._overrides[station_id])
+
+        if not self._adaptive or station_id not in self._estimates:
+            return self._default
+
+        return min(max(math.ceil(self._estimates[station_id]), self._min_results), self._max_results)
+
+    def estimate(self, station_id: str) -> float|None:
+        return self._estimates.get(station_id)
+
+    def restore(self, station_id: str, estimate: float) -> None:
+        self._estimates[station_id] = estimate
+
+    def update(self, station_id: str, departures: List[float], num_requested: int, now: float) -> None:
+        if not self._adaptive or station_id in self._overrides:
+            return
+
+        upcoming = sorted(d for d in departures if d >= now)
+
+        # number of departures within the time which needs to be covered by one request,
+        # if the window was full and ended before, the number is extrapolated by the density
+        if len(upcoming) >= num_requested and len(upcoming) > 0 and upcoming[-1] < now + self._coverage:
+            span = max(upcoming[-1] - now, 1.0)
+            required = len(upcoming) * self._coverage / span
+        else:
+            required = len([d for d in upcoming if d <= now + self._coverage])
+
+        # add some headroom for delayed trips and smooth the estimate over several requests
+        required = required * 1.25 + 1
+
+        if station_id in self._estimates:
+            self._estimates[station_id] = 0.5 * self._estimates[station_id] + 0.5 * required
+        else:
+            self._estimates[station_id] = required
@@ -1,221 +1,212 @@
 import datetime
 import logging
-import requests
+import threading
 
+from collections import OrderedDict
+from typing import Dict
 from typing import List
+from typing import Set
 
+from ticktrack.client import CircuitOpenError
+from ticktrack.client import TriasClient
 from ticktrack.datalog import Datalog
-from ticktrack.request import TriasRequest
+from ticktrack.metrics import Metrics
+from ticktrack.parser import StopEventRecord
+from ticktrack.parser import StopEventResponseError
+from ticktrack.parser import fingerprint
+from ticktrack.parser import parse_stop_event_response
+from ticktrack.parser import parse_stop_event_result
+from ticktrack.parser import split_stop_event_response
 from ticktrack.request import StopEventRequest
-from ticktrack.response import TriasResponse
-from ticktrack.response import xml2trias_response
-from ticktrack.model import MonitoredTrip
-from ticktrack.triasxml import exists as triasxml_exists
-from ticktrack.triasxml import get_value as triasxml_get_value
+from ticktrack.request import StopEventRequestTemplate
+from ticktrack.store import TripStore
+from ticktrack.window import ResultWindow
 
 class MonitorWorker:
 
-    def __init__(self, database: str, endpoint: str, key: str, datalog: str|None = None) -> None:
-        self._database = database
-        self._endpoint = endpoint
+    def __init__(self, client: TriasClient, key: str, datalog: Datalog|None = None, store: TripStore|None = None, window: ResultWindow|None = None, metrics: Metrics|None = None, incremental: bool = False, fingerprint_cache_size: int = 10000, delay_log: bool = False) -> None:
+        self._client = client
         self._key = key
         self._datalog = datalog
-
-        self.next_departure_timestamp = None
+        self._store = store if store is not None else TripStore()
+        self._window = window if window is not None else ResultWindow(0, adaptive=False)
+        self._metrics = metrics if metrics is not None else Metrics()
+        self._templates: Dict[int, StopEventRequestTemplate] = dict()
+
+        # calls are only parsed if their delays are recorded
+        self._delay_log = delay_log
+
+        # fingerprints of the results of the last request per station and the records of results
+        # which have not changed since then, the latter are not processed again, records are
+        # identified by object as a trip may be contained several times in one response
+        self._incremental = incremental
+        self._fingerprint_cache_size = fingerprint_cache_size
+        self._fingerprints: OrderedDict[str, Dict[int, StopEventRecord|None]] = OrderedDict()
+        self._fingerprints_lock = threading.Lock()
+        self._unchanged: Dict[str, Set[int]] = dict()
 
     def start(self, station_id: str, line_ids: List[str]|None = None) -> None:
-        self.next_departure_timestamp = self._run(station_id, line_ids)
-
-    def _run(self, station_id: str, line_ids: List[str]|None = None) -> datetime.datetime|None:
-        
-        # send request
-        request = StopEventRequest(self._key, station_id, self._current_iso_timestamp())
-        response = self._request(request)
-
-        # process results
-        if triasxml_exists(response, 'Trias.ServiceDelivery.DeliveryPayload.StopEventResponse.StopEventResult'):
-            for stop_event_result in response.Trias.ServiceDelivery.DeliveryPayload.StopEventResponse.StopEventResult:
-                
-                # obtain variables for identification of monitored trip
-                operation_day = triasxml_get_value(stop_event_result, 'StopEvent.Service.OperatingDayRef')
-                trip_id = triasxml_get_value(stop_event_result, 'StopEvent.Service.JourneyRef')
-                line_id = triasxml_get_value(stop_event_result, 'StopEvent.Service.LineRef')
-
-                # apply line name filter if available
-                if line_ids is not None and len(line_ids) > 0:
-                    if not any([line_id.startswith(id) for id in line_ids]):
-                        continue
-
-                # identify monitored trip instance
-                monitored_trip = MonitoredTrip.select((MonitoredTrip.q.operation_day == operation_day) & (MonitoredTrip.q.trip_id == trip_id)).getOne(default=None)
-                if monitored_trip is None:
-                    
-                    # gather all data to generate a new monitored trip instance for this operation day
-                    line_name = triasxml_get_value(stop_event_result, 'StopEvent.Service.PublishedLineName.Text')
-                    origin_stop_id = triasxml_get_value(stop_event_result, 'StopEvent.Service.OriginStopPointRef')
-                    origin_stop_name = triasxml_get_value(stop_event_result, 'StopEvent.Service.OriginText.Text')
-                    destination_stop_id = triasxml_get_value(stop_event_result, 'StopEvent.Service.DestinationStopPointRef')
-                    destination_stop_name = triasxml_get_value(stop_event_result, 'StopEvent.Service.DestinationText.Text')
-
-                    if triasxml_exists(stop_event_result, 'StopEvent.PreviousCall'):
-                        first_call = stop_event_result.StopEvent.PreviousCall[0]
-
-                        start_time = triasxml_get_value(first_call, 'CallAtStop.ServiceDeparture.TimetabledTime')
-                        start_time = start_time.replace('Z', '+00:00')
-                    elif triasxml_exists(stop_event_result, 'StopEvent.ThisCall'):
-                        this_call = stop_event_result.StopEvent.ThisCall
-
-                        start_time = triasxml_get_value(this_call, 'CallAtStop.ServiceDeparture.TimetabledTime')
-                        start_time = start_time.replace('Z', '+00:00')
-                    else:
-                        start_time = ""
-
-                    if triasxml_exists(stop_event_result, 'StopEvent.OnwardCall'):
-                        last_call = stop_event_result.StopEvent.OnwardCall[-1]
-
-                        end_time = triasxml_get_value(last_call, 'CallAtStop.ServiceArrival.TimetabledTime')
-                        end_time = end_time.replace('Z', '+00:00')
-                    elif triasxml_exists(stop_event_result, 'StopEvent.ThisCall'):
-                        this_call = stop_event_result.StopEvent.ThisCall
-
-                        end_time = triasxml_get_value(this_call, 'CallAtStop.ServiceArrival.TimetabledTime')
-                        end_time = start_time.replace('Z', '+00:00')
-                    else:
-                        end_time = ""
-
-                    # check realtime existence
-                    realtime_ref_station = station_id
-
-                    if triasxml_exists(stop_event_result, 'StopEvent.ThisCall.CallAtStop.ServiceDeparture.EstimatedTime'):
-                        realtime_first_appeared = self._current_iso_timestamp()
-                    else:
-                        realtime_first_appeared = None
-
-                    realtime_cancelled, realtime_num_cancelled_stops, realtime_num_added_stops = self._get_realtime_metrics(stop_event_result)
-                    
-                    # create monitored trip object
-                    MonitoredTrip(
-                        operation_day=operation_day,
-                        trip_id=trip_id,
-                        line_id=line_id,
-                        line_name=line_name,
-                        origin_stop_id=origin_stop_id,
-                        origin_name=origin_stop_name,
-                        destination_stop_id=destination_stop_id,
-                        destination_name=destination_stop_name,
-                        start_time=start_time,
-                        end_time=end_time,
-                        realtime_ref_station=realtime_ref_station,
-                        realtime_first_appeared=realtime_first_appeared,
-                        realtime_cancelled=realtime_cancelled,
-                        realtime_num_cancelled_stops=realtime_num_cancelled_stops,
-                        realtime_num_added_stops=realtime_num_added_stops
-                    )
+        response = self.fetch(station_id)
+        self.process(station_id, response, line_ids)
+
+        self._store.flush()
+
+    def fetch(self, station_id: str) -> List[StopEventRecord]|None:
+        # fetching does not touch the database and is therefore safe to be run
+        # concurrently for several stations
+        num_results = self._window.num_results(station_id)
+        if num_results not in self._templates:
+            self._templates[num_results] = StopEventRequestTemplate(self._key, num_results)
+
+        with self._metrics.timer('station', station_id=station_id):
+            request = self._templates[num_results].render(station_id, self._current_iso_timestamp())
+            response = self._request(StopEventRequest.__name__, request, station_id)
+
+            if response is None:
+                return None
+            
+            try:
+                with self._metrics.timer('parse'):
+                    if self._incremental:
+                        return self._parse_incremental(station_id, response)
                     
-                else:
-
-                    # only update the trip if there's no realtime available yet
-                    if monitored_trip.realtime_first_appeared == None:
-                        # check realtime existence
-                        if triasxml_exists(stop_event_result, 'StopEvent.ThisCall.CallAtStop.ServiceDeparture.EstimatedTime'):
-                            realtime_first_appeared = self._current_iso_timestamp()
-                            monitored_trip.realtime_first_appeared = realtime_first_appeared
-
-                    # update realtime metrics if there's something special
-                    realtime_cancelled, realtime_num_cancelled_stops, realtime_num_added_stops = self._get_realtime_metrics(stop_event_result)
-                    if realtime_cancelled > monitored_trip.realtime_cancelled \
-                        or realtime_num_cancelled_stops > monitored_trip.realtime_num_cancelled_stops \
-                        or realtime_num_added_stops > monitored_trip.realtime_num_added_stops:
-
-                        monitored_trip.realtime_cancelled = realtime_cancelled
-                        monitored_trip.realtime_num_cancelled_stops = realtime_num_cancelled_stops
-                        monitored_trip.realtime_num_added_stops = realtime_num_added_stops           
-
-            # return first departure time found
-            first_stop_event_result = response.Trias.ServiceDelivery.DeliveryPayload.StopEventResponse.StopEventResult[0]
-            if triasxml_exists(first_stop_event_result, 'StopEvent.ThisCall'):
-                this_call = first_stop_event_result.StopEvent.ThisCall
-
-                if triasxml_exists(this_call, 'CallAtStop.ServiceDeparture'):
-                    next_departure_timestamp = triasxml_get_value(this_call, 'CallAtStop.ServiceDeparture.TimetabledTime')
-                    next_departure_timestamp = next_departure_timestamp.replace('Z', '+00:00')
-
-                    return datetime.datetime.fromisoformat(next_departure_timestamp)
-                elif triasxml_exists(this_call, 'CallAtStop.ServiceArrival'):
-                    next_departure_timestamp = triasxml_get_value(this_call, 'CallAtStop.ServiceArrival.TimetabledTime')
-                    next_departure_timestamp = next_departure_timestamp.replace('Z', '+00:00')
-
-                    return datetime.datetime.fromisoformat(next_departure_timestamp)
-                else:
-                    return None
-            else:
+                    return parse_stop_event_response(response, self._delay_log)
+            except StopEventResponseError as ex:
+                # the station is requested again with the default interval, errors are no empty results
+                logging.warning(f"Station {station_id}: {ex}")
+                self._metrics.increment('errors', phase='response')
+
                 return None
-        else:
+            except Exception as ex:
+                logging.error(ex)
+                self._metrics.increment('errors', phase='parse')
+
+                return None
+
+    def process(self, station_id: str, records: List[StopEventRecord]|None, line_ids: List[str]|None = None, timestamp: str|None = None) -> List[float]|None:
+        # processing writes to the database and must be called by one single thread only
+        # the timestamp of the response is the current time unless recorded responses are processed
+        with self._metrics.timer('process'):
+            return self._run(station_id, records, line_ids, timestamp if timestamp is not None else self._current_iso_timestamp())
+
+    def _run(self, station_id: str, records: List[StopEventRecord]|None, line_ids: List[str]|None, timestamp: str) -> List[float]|None:
+        unchanged = self._unchanged.pop(station_id, None)
+
+        # failed requests and error responses are requested again with the default interval
+        if records is None:
             return None
 
+        # apply line name filter if available
+        if line_ids is not None and len(line_ids) > 0:
+            monitored_records = [r for r in records if any([r.line_id.startswith(id) for id in line_ids])]
+        else:
+            monitored_records = records
+
+        # new trips and changes are collected by the trip store and written with its next flush,
+        # results which are the same as in the last request have been observed already
+        if unchanged is not None and len(unchanged) > 0:
+            self._store.observe(station_id, [r for r in monitored_records if id(r) not in unchanged], timestamp)
+        else:
+            self._store.observe(station_id, monitored_records, timestamp)
+
+        # return all departures which still need to be observed, these are the monitored trips without
+        # realtime data and the end of the visible window as there may be further trips behind
+        departures = [
+            datetime.datetime.fromisoformat(r.departure_time).timestamp() for r in monitored_records 
+            if r.departure_time is not None and not self._store.has_realtime(r.operation_day, r.trip_id)
+        ]
+
+        num_requested = self._window.num_results(station_id)
+        if len(records) >= num_requested and records[-1].departure_time is not None:
+            departures.append(datetime.datetime.fromisoformat(records[-1].departure_time).timestamp())
+
+        # learn the number of results required for this station from all departures
+        self._window.update(
+            station_id, 
+            [datetime.datetime.fromisoformat(r.departure_time).timestamp() for r in records if r.departure_time is not None], 
+            num_requested,
+            datetime.datetime.fromisoformat(timestamp).timestamp()
+        )
+
+        return departures
+
+    def _parse_incremental(self, station_id: str, response: bytes) -> List[StopEventRecord]:
+        namespaces, fragments = split_stop_event_response(response)
+
+        # responses without any results are parsed completely in order to detect errors
+        if len(fragments) == 0:
+            parse_stop_event_response(response)
+
+        with self._fingerprints_lock:
+            previous = self._fingerprints.get(station_id, dict())
+
+        # only results which have changed since the last request are parsed
+        records = list()
+        fingerprints = dict()
+        unchanged = set()
+        num_unchanged = 0
+        for fragment in fragments:
+            key = fingerprint(fragment, self._delay_log)
+            if key in previous:
+                record = previous[key]
+                if record is not None:
+                    unchanged.add(id(record))
+                    num_unchanged = num_unchanged + 1
+            else:
+                record = parse_stop_event_result(fragment, namespaces, self._delay_log)
+
+            fingerprints[key] = record
+            if record is not None:
+                records.append(record)
+
+        with self._fingerprints_lock:
+            self._fingerprints[station_id] = fingerprints
+            self._fingerprints.move_to_end(station_id)
+
+            while len(self._fingerprints) > self._fingerprint_cache_size:
+                self._fingerprints.popitem(last=False)
+
+        self._unchanged[station_id] = unchanged
+        self._metrics.increment('results_unchanged', num_unchanged)
+
+        return records
+
     def _current_iso_timestamp(self) -> str:
         return datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0).isoformat()
     
-    def _get_realtime_metrics(self, stop_event_result: object) -> str:
-        realtime_cancelled = 0
-        realtime_num_cancelled_stops = 0
-        realtime_num_added_stops = 0
-        
-        if triasxml_exists(stop_event_result, 'StopEvent.Service.Cancelled') and stop_event_result.StopEvent.Service.Cancelled:
-            realtime_cancelled = 1
-        
-        if triasxml_exists(stop_event_result, 'StopEvent.PreviousCall'):
-            for call in stop_event_result.StopEvent.PreviousCall:
-                if triasxml_exists(call, 'CallAtStop.NotServicedStop') and call.CallAtStop.NotServicedStop:
-                    realtime_num_cancelled_stops = realtime_num_cancelled_stops + 1
-
-                if triasxml_exists(call, 'CallAtStop.UnplannedStop') and call.CallAtStop.UnplannedStop:
-                    realtime_num_added_stops = realtime_num_added_stops + 1
-
-        if triasxml_exists(stop_event_result, 'StopEvent.ThisCall'):
-            if triasxml_exists(stop_event_result.StopEvent.ThisCall, 'CallAtStop.NotServicedStop') and stop_event_result.StopEvent.ThisCall.CallAtStop.NotServicedStop:
-                realtime_num_cancelled_stops = realtime_num_cancelled_stops + 1
-
-            if triasxml_exists(stop_event_result.StopEvent.ThisCall, 'CallAtStop.UnplannedStop') and stop_event_result.StopEvent.ThisCall.CallAtStop.UnplannedStop:
-                realtime_num_added_stops = realtime_num_added_stops + 1
-
-        if triasxml_exists(stop_event_result, 'StopEvent.OnwardCall'):
-            for call in stop_event_result.StopEvent.OnwardCall:
-                if triasxml_exists(call, 'CallAtStop.NotServicedStop') and call.CallAtStop.NotServicedStop:
-                    realtime_num_cancelled_stops = realtime_num_cancelled_stops + 1
-
-                if triasxml_exists(call, 'CallAtStop.UnplannedStop') and call.CallAtStop.UnplannedStop:
-                    realtime_num_added_stops = realtime_num_added_stops + 1
-
-        return (realtime_cancelled, realtime_num_cancelled_stops, realtime_num_added_stops)
-    
-    def _request(self, request: TriasRequest) -> TriasResponse:
-        headers = {
-            'Content-Type': 'application/xml',
-            'User-Agent': 'ticktrack-worker'
-        }
-        
+    def _request(self, request_type: str, request: bytes, station_id: str) -> bytes|None:
         try:
             if self._datalog is not None:
-                Datalog.create(self._datalog, request.xml(), {
-                    'method': 'POST',
-                    'endpoint': self._endpoint,
-                    'headers': headers
-                }, 'OUT', type(request).__name__, 'Request')
+                with self._metrics.timer('datalog'):
+                    self._datalog.create(request, {
+                        'method': 'POST',
+                        'endpoint': self._client.endpoint,
+                        'headers': self._client.headers,
+                        'station_id': station_id
+                    }, 'OUT', request_type, 'Request')
             
-            response_xml = requests.post(self._endpoint, headers=headers, data=request.xml())
+            self._metrics.increment('requests')
+            with self._metrics.timer('request'):
+                response = self._client.post(request)
 
             if self._datalog is not None:
-                Datalog.create(self._datalog, response_xml.content, {
-                    'method': 'POST',
-                    'endpoint': self._endpoint,
-                    'headers': headers
-                }, 'OUT', type(request).__name__, 'Response')
-
-            response = xml2trias_response(response_xml.content)
+                with self._metrics.timer('datalog'):
+                    self._datalog.create(response, {
+                        'method': 'POST',
+                        'endpoint': self._client.endpoint,
+                        'headers': self._client.headers,
+                        'station_id': station_id
+                    }, 'OUT', request_type, 'Response')
 
             return response
+        except CircuitOpenError as ex:
+            # the endpoint is known to be unavailable, the station is requested again with the next cycle
+            logging.debug(ex)
+            self._metrics.increment('circuit_open')
+
+            return None
         except Exception as ex:
             logging.error(ex)
+            self._metrics.increment('errors', phase='request')
 
             return None
\ No newline at end of file
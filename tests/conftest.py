@@ -0,0 +1,21 @@
+import pytest
+
+from sqlobject import connectionForURI
+
+from ticktrack.schema import Schema
+
+@pytest.fixture
+def connection(tmp_path):
+    # each test uses its own database file, SQLObject caches connections per URI
+    connection = connectionForURI(f"sqlite:{tmp_path / 'ticktrack.db3'}")
+    Schema.upgrade(connection)
+
+    yield connection
+
+    connection.close()
+
+@pytest.fixture
+def compact_connection(connection):
+    Schema.compact(connection)
+
+    return connection
@@ -0,0 +1,68 @@
+import csv
+import datetime
+import gzip
+import os
+import sqlite3
+
+import pytest
+
+from ticktrack.archive import Archive
+
+_COLUMNS = 'operation_day, trip_id, line_id, line_name, realtime_ref_station, realtime_cancelled, realtime_num_cancelled_stops, realtime_num_added_stops'
+
+def _insert(connection, operation_day: str, trip_ids: list) -> None:
+    for trip_id in trip_ids:
+        connection.query(f"INSERT INTO monitored_trip ({_COLUMNS}) VALUES ('{operation_day}', '{trip_id}', 'line-1', '1', 'stop-a', 0, 0, 0)")
+        connection.query(
+            "INSERT INTO call_delay (operation_day, trip_id, stop_seq, stop_id, timetabled_time, estimated_time, observed_at) " \
+            f"VALUES ('{operation_day}', '{trip_id}', 1, 'stop-a', 1714557600, 1714557660, 1714557500)"
+        )
+
+def _archived(directory: str, archive_format: str) -> list:
+    if archive_format == 'csv':
+        with gzip.open(os.path.join(directory, 'ticktrack-2024-05.csv.gz'), 'rt', encoding='utf-8', newline='') as csv_file:
+            trips = sorted((r['operation_day'], r['trip_id']) for r in csv.DictReader(csv_file))
+
+        with gzip.open(os.path.join(directory, 'ticktrack-2024-05.call_delay.csv.gz'), 'rt', encoding='utf-8', newline='') as csv_file:
+            delays = sorted((r['operation_day'], r['trip_id'], r['stop_seq']) for r in csv.DictReader(csv_file))
+    else:
+        archive = sqlite3.connect(os.path.join(directory, 'ticktrack-2024-05.db3'))
+        trips = sorted(archive.execute('SELECT operation_day, trip_id FROM monitored_trip').fetchall())
+        delays = sorted((d, t, str(s)) for d, t, s in archive.execute('SELECT operation_day, trip_id, stop_seq FROM call_delay').fetchall())
+        archive.close()
+
+    return [trips, delays]
+
+@pytest.mark.parametrize('archive_format', ['sqlite', 'csv'])
+def test_archive(connection, tmp_path, archive_format):
+    directory = str(tmp_path / 'archive')
+    _insert(connection, '2024-05-01', ['trip-1', 'trip-2'])
+    _insert(connection, '2024-05-02', ['trip-1'])
+    _insert(connection, '2024-05-03', ['trip-1'])
+
+    # the operation day before today is kept
+    archive = Archive(directory, 2, archive_format, connection)
+    assert archive.run(datetime.date(2024, 5, 4)) == (2, 3)
+
+    assert connection.queryAll('SELECT operation_day, trip_id FROM monitored_trip') == [('2024-05-03', 'trip-1')]
+    assert _archived(directory, archive_format) == [
+        [('2024-05-01', 'trip-1'), ('2024-05-01', 'trip-2'), ('2024-05-02', 'trip-1')],
+        [('2024-05-01', 'trip-1', '1'), ('2024-05-01', 'trip-2', '1'), ('2024-05-02', 'trip-1', '1')]
+    ]
+
+@pytest.mark.parametrize('archive_format', ['sqlite', 'csv'])
+def test_archive_again(connection, tmp_path, archive_format):
+    directory = str(tmp_path / 'archive')
+    _insert(connection, '2024-05-01', ['trip-1', 'trip-2'])
+    _insert(connection, '2024-05-02', ['trip-1'])
+
+    Archive(directory, 2, archive_format, connection).run(datetime.date(2024, 5, 4))
+
+    # an archived day appears in the database again, e.g. by merging a shard, each row is archived once only
+    _insert(connection, '2024-05-01', ['trip-2', 'trip-3'])
+    assert Archive(directory, 2, archive_format, connection).run(datetime.date(2024, 5, 4)) == (1, 2)
+
+    assert _archived(directory, archive_format) == [
+        [('2024-05-01', 'trip-1'), ('2024-05-01', 'trip-2'), ('2024-05-01', 'trip-3'), ('2024-05-02', 'trip-1')],
+        [('2024-05-01', 'trip-1', '1'), ('2024-05-01', 'trip-2', '1'), ('2024-05-01', 'trip-3', '1'), ('2024-05-02', 'trip-1', '1')]
+    ]
@@ -0,0 +1,45 @@
+import zipfile
+
+from ticktrack.optimize import StationOptimizer
+
+def _feed(path, stop_times: list) -> str:
+    filename = str(path / 'gtfs.zip')
+    with zipfile.ZipFile(filename, 'w') as feed:
+        stop_ids = sorted(set(s[1] for s in stop_times))
+        trip_ids = sorted(set(s[0] for s in stop_times))
+
+        feed.writestr('stops.txt', 'stop_id,stop_name,parent_station\n' + ''.join(f"{s},Stop {s},\n" for s in stop_ids))
+        feed.writestr('trips.txt', 'route_id,service_id,trip_id\n' + ''.join(f"route-1,daily,{t}\n" for t in trip_ids))
+        feed.writestr('stop_times.txt', 'trip_id,arrival_time,departure_time,stop_id,stop_sequence,pickup_type\n' + ''.join(
+            f"{t},10:00:00,10:00:00,{s},{n},{p}\n" for t, s, n, p in stop_times
+        ))
+
+    return filename
+
+def test_last_stop(tmp_path):
+    # both trips end at S2, where they are never returned as departure
+    filename = _feed(tmp_path, [
+        ('trip-1', 'S1', 1, ''),
+        ('trip-1', 'S2', 2, ''),
+        ('trip-2', 'S2', 2, ''),
+        ('trip-2', 'S3', 1, '')
+    ])
+
+    stations = StationOptimizer().run(filename)
+
+    assert sorted(s.station_id for s in stations) == ['S1', 'S3']
+    assert all(s.num_trips == 1 and s.num_departures == 1 for s in stations)
+
+def test_no_pickup(tmp_path):
+    filename = _feed(tmp_path, [
+        ('trip-1', 'S1', 1, '1'),
+        ('trip-1', 'S2', 2, '0'),
+        ('trip-1', 'S3', 3, ''),
+        ('trip-2', 'S1', 1, '1'),
+        ('trip-2', 'S4', 2, ''),
+        ('trip-2', 'S3', 3, '')
+    ])
+
+    stations = StationOptimizer().run(filename)
+
+    assert sorted(s.station_id for s in stations) == ['S2', 'S4']
@@ -0,0 +1,97 @@
+from ticktrack.scheduler import StationScheduler
+
+class FakeClock:
+
+    def __init__(self, now: float = 1000.0) -> None:
+        self.now = now
+        self.sleeps = list()
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now = self.now + seconds
+
+def _scheduler(clock: FakeClock) -> StationScheduler:
+    return StationScheduler(interval=60, lead_time=300, max_interval=1800, clock=clock, sleep=clock.sleep)
+
+def test_due_time_failed_request():
+    scheduler = _scheduler(FakeClock())
+
+    assert scheduler.due_time(None, 1000) == 1060
+
+def test_due_time_empty_window():
+    scheduler = _scheduler(FakeClock())
+
+    assert scheduler.due_time([], 1000) == 2800
+    assert scheduler.due_time([900, 999], 1000) == 2800
+
+def test_due_time_lead_time():
+    scheduler = _scheduler(FakeClock())
+
+    # polled again the lead time before the next upcoming departure
+    assert scheduler.due_time([500, 2000, 1500], 1000) == 1200
+
+def test_due_time_clamped():
+    scheduler = _scheduler(FakeClock())
+
+    # not earlier than the interval and not later than the max. interval
+    assert scheduler.due_time([1100], 1000) == 1060
+    assert scheduler.due_time([5000], 1000) == 2800
+
+def test_pop_due():
+    clock = FakeClock()
+    scheduler = _scheduler(clock)
+
+    scheduler.add('a')
+    scheduler.add('b', 1003)
+    scheduler.add('c', 1100)
+
+    assert scheduler.pop_due() == ['a']
+    assert scheduler.pop_due(tolerance=5) == ['b']
+    assert scheduler.pop_due(tolerance=5) == []
+    assert len(scheduler) == 1
+    assert scheduler.next_due() == 1100
+
+def test_reschedule():
+    clock = FakeClock()
+    scheduler = _scheduler(clock)
+
+    scheduler.add('a')
+    scheduler.add('b')
+    assert scheduler.pop_due() == ['a', 'b']
+
+    assert scheduler.reschedule('a', [2000]) == 1700
+    assert scheduler.reschedule('b', None) == 1060
+    assert scheduler.next_due() == 1060
+
+    # rescheduling a station again replaces its previous due time
+    assert scheduler.reschedule('b', []) == 2800
+    assert scheduler.next_due() == 1700
+
+    scheduler.wait()
+    assert clock.now == 1700
+    assert scheduler.pop_due() == ['a']
+
+def test_wait_without_stations():
+    clock = FakeClock()
+    scheduler = _scheduler(clock)
+
+    scheduler.wait()
+    assert clock.sleeps == [60]
+
+def test_reschedule_relative_to_cycle_start():
+    clock = FakeClock()
+    scheduler = _scheduler(clock)
+
+    scheduler.add('a')
+    cycle_start = scheduler.now()
+    assert scheduler.pop_due() == ['a']
+
+    # a slow request must not delay the station beyond the next scheduled run
+    clock.now = clock.now + 20
+    assert scheduler.reschedule('a', None, cycle_start) == 1060
+
+    clock.now = cycle_start + 60
+    assert scheduler.pop_due(tolerance=5) == ['a']
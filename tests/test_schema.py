@@ -0,0 +1,106 @@
+import pytest
+
+from sqlobject import connectionForURI
+
+from ticktrack.model import MonitoredTrip
+from ticktrack.schema import Schema
+
+_COLUMNS = 'operation_day, trip_id, line_id, line_name, origin_stop_id, origin_name, destination_stop_id, destination_name, start_time, end_time, ' \
+    'realtime_ref_station, realtime_first_appeared, realtime_cancelled, realtime_num_cancelled_stops, realtime_num_added_stops'
+
+_TRIPS = [
+    ('2024-05-01', 'trip-1', 'line-1', '1', 'stop-a', 'A', 'stop-b', 'B', '2024-05-01T10:00:00+00:00', '2024-05-01T10:30:00+00:00', 'stop-a', '2024-05-01T09:55:00+00:00', 0, 0, 0),
+    ('2024-05-01', 'trip-2', 'line-1', '1', 'stop-b', 'B', 'stop-a', 'A', '2024-05-01T11:00:00+00:00', '2024-05-01T11:30:00+00:00', 'stop-b', None, 1, 2, 0),
+    ('2024-05-01', 'trip-3', 'line-2', '2', 'stop-a', 'A', 'stop-c', 'C', '2024-05-01T12:00:00+00:00', '2024-05-01T12:20:00+00:00', 'stop-a', None, 0, 0, 1),
+    ('2024-05-02', 'trip-1', 'line-1', '1', 'stop-a', 'A', 'stop-b', 'B', '2024-05-02T10:00:00+00:00', '2024-05-02T10:30:00+00:00', 'stop-a', None, 0, 0, 0),
+    ('2024-05-02', 'trip-4', None, None, 'stop-c', 'C', 'stop-a', 'A', '2024-05-02T13:00:00+00:00', '2024-05-02T13:40:00+00:00', 'stop-c', '2024-05-02T12:58:00+00:00', 0, 1, 1)
+]
+
+def _insert(connection, trips: list) -> None:
+    for trip in trips:
+        connection.query(f"INSERT INTO monitored_trip ({_COLUMNS}) VALUES ({', '.join(connection.sqlrepr(v) for v in trip)})")
+
+def _trips(connection) -> list:
+    return connection.queryAll(f"SELECT id, {_COLUMNS} FROM monitored_trip ORDER BY id")
+
+def _summaries(connection) -> list:
+    return connection.queryAll('SELECT * FROM line_summary ORDER BY operation_day, line_id')
+
+def _expected_summaries(connection) -> list:
+    # the same aggregation which is used for creating the summaries of existing trips
+    return connection.queryAll(
+        "SELECT operation_day, COALESCE(line_id, ''), MAX(line_name), COUNT(*), " \
+        "SUM(realtime_first_appeared IS NOT NULL), SUM(realtime_cancelled > 0), SUM(realtime_num_cancelled_stops > 0), SUM(realtime_num_added_stops > 0) " \
+        "FROM monitored_trip WHERE operation_day IS NOT NULL GROUP BY operation_day, COALESCE(line_id, '') ORDER BY 1, 2"
+    )
+
+def _write(connection) -> None:
+    # new realtime data, a cancellation and a trip whose realtime data has gone
+    connection.query("UPDATE monitored_trip SET realtime_first_appeared = '2024-05-01T10:58:00+00:00', realtime_cancelled = 0 WHERE operation_day = '2024-05-01' AND trip_id = 'trip-2'")
+    connection.query("UPDATE monitored_trip SET realtime_cancelled = 1, realtime_num_cancelled_stops = 3 WHERE operation_day = '2024-05-02' AND trip_id = 'trip-1'")
+    connection.query("UPDATE monitored_trip SET realtime_first_appeared = NULL WHERE operation_day = '2024-05-01' AND trip_id = 'trip-1'")
+
+@pytest.fixture(params=['plain', 'compact'])
+def layout(request, connection):
+    if request.param == 'compact':
+        Schema.compact(connection)
+
+    return connection
+
+def test_summaries(layout):
+    _insert(layout, _TRIPS)
+    assert _summaries(layout) == _expected_summaries(layout)
+
+    _write(layout)
+    assert _summaries(layout) == _expected_summaries(layout)
+
+def test_summaries_kept_on_delete(layout):
+    _insert(layout, _TRIPS)
+    summaries = _summaries(layout)
+
+    # summaries cover the whole history, archived trips are still counted
+    layout.query("DELETE FROM monitored_trip WHERE operation_day = '2024-05-01'")
+
+    assert _summaries(layout) == summaries
+    assert [t[1] for t in _trips(layout)] == ['2024-05-02', '2024-05-02']
+
+def test_summaries_of_existing_trips(tmp_path):
+    # trips which have been written before the summaries existed are counted by the migration
+    connection = connectionForURI(f"sqlite:{tmp_path / 'existing.db3'}")
+    MonitoredTrip.createTable(connection=connection)
+    _insert(connection, _TRIPS)
+
+    Schema.upgrade(connection)
+
+    assert _summaries(connection) == _expected_summaries(connection)
+
+    connection.close()
+
+def test_compact_round_trip(connection):
+    _insert(connection, _TRIPS)
+    _write(connection)
+
+    trips = _trips(connection)
+    summaries = _summaries(connection)
+
+    assert Schema.compact(connection)
+    assert Schema.is_compact(connection)
+
+    # the view returns exactly the same rows, IDs included
+    assert _trips(connection) == trips
+    assert _summaries(connection) == summaries
+
+    # and is written like the table
+    _insert(connection, [('2024-05-03', 'trip-5', 'line-2', '2', 'stop-c', 'C', 'stop-a', 'A', '2024-05-03T08:00:00+00:00', '2024-05-03T08:30:00+00:00', 'stop-c', None, 0, 0, 0)])
+    connection.query("UPDATE monitored_trip SET realtime_first_appeared = '2024-05-03T07:59:00+00:00' WHERE operation_day = '2024-05-03' AND trip_id = 'trip-5'")
+
+    rows = _trips(connection)
+    assert rows[:-1] == trips
+    assert rows[-1][1:] == ('2024-05-03', 'trip-5', 'line-2', '2', 'stop-c', 'C', 'stop-a', 'A', '2024-05-03T08:00:00+00:00', '2024-05-03T08:30:00+00:00', 'stop-c', '2024-05-03T07:59:00+00:00', 0, 0, 0)
+    assert _summaries(connection) == _expected_summaries(connection)
+
+def test_compact_rejects_invalid_timestamps(compact_connection):
+    with pytest.raises(Exception):
+        _insert(compact_connection, [('2024-05-01', 'trip-1', 'line-1', '1', 'stop-a', 'A', 'stop-b', 'B', 'invalid', None, 'stop-a', None, 0, 0, 0)])
+
+    assert _trips(compact_connection) == []
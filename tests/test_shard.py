@@ -0,0 +1,95 @@
+import datetime
+import signal
+import subprocess
+import sys
+
+import pytest
+
+from sqlobject import connectionForURI
+
+from ticktrack.archive import Archive
+from ticktrack.schema import Schema
+from ticktrack.shard import ShardMerger
+from ticktrack.shard import ShardSupervisor
+from ticktrack.shard import shard_path
+
+_COLUMNS = 'operation_day, trip_id, line_id, line_name, realtime_ref_station, realtime_first_appeared, realtime_cancelled, realtime_num_cancelled_stops, realtime_num_added_stops'
+
+@pytest.fixture
+def shard(tmp_path):
+    filename = shard_path(str(tmp_path / 'ticktrack.db3'), 1, 2)
+
+    connection = connectionForURI(f"sqlite:{filename}")
+    Schema.upgrade(connection)
+
+    for operation_day, trip_id, realtime_first_appeared in [
+        ('2024-05-01', 'trip-1', '2024-05-01T09:55:00+00:00'),
+        ('2024-05-01', 'trip-2', None),
+        ('2024-05-02', 'trip-1', None)
+    ]:
+        connection.query(
+            f"INSERT INTO monitored_trip ({_COLUMNS}) VALUES " \
+            f"('{operation_day}', '{trip_id}', 'line-1', '1', 'stop-a', {connection.sqlrepr(realtime_first_appeared)}, 0, 0, 0)"
+        )
+
+    yield (filename, connection)
+
+    connection.close()
+
+def _trips(connection) -> list:
+    return connection.queryAll('SELECT operation_day, trip_id, realtime_first_appeared FROM monitored_trip ORDER BY operation_day, trip_id')
+
+def _num_trips(connection) -> list:
+    return connection.queryAll('SELECT operation_day, num_trips, num_realtime FROM line_summary ORDER BY operation_day')
+
+def test_merge(connection, shard):
+    filename, shard_connection = shard
+
+    assert ShardMerger(connection).merge(filename) == (3, '2024-05-02')
+
+    assert _trips(connection) == _trips(shard_connection)
+    assert _num_trips(connection) == [('2024-05-01', 2, 1), ('2024-05-02', 1, 0)]
+
+def test_merge_again(connection, shard):
+    filename, shard_connection = shard
+    ShardMerger(connection).merge(filename)
+
+    # realtime data of the last two operation days is merged again, also after a restart
+    shard_connection.query("UPDATE monitored_trip SET realtime_first_appeared = '2024-05-02T10:00:00+00:00' WHERE operation_day = '2024-05-02'")
+    ShardMerger(connection).merge(filename)
+
+    assert _trips(connection) == _trips(shard_connection)
+    assert _num_trips(connection) == [('2024-05-01', 2, 1), ('2024-05-02', 1, 1)]
+
+def test_merge_after_archive(connection, shard, tmp_path):
+    filename, shard_connection = shard
+    ShardMerger(connection).merge(filename)
+
+    archive = Archive(str(tmp_path / 'archive'), 2, 'sqlite', connection)
+    assert archive.run(datetime.date(2024, 5, 4)) == (2, 3)
+
+    # archived operation days are not merged again and not counted twice
+    assert ShardMerger(connection).merge(filename, archive.boundary(datetime.date(2024, 5, 4))) == (0, '2024-05-02')
+
+    assert _trips(connection) == []
+    assert _num_trips(connection) == [('2024-05-01', 2, 1), ('2024-05-02', 1, 0)]
+
+def test_merge_prune(connection, shard):
+    filename, shard_connection = shard
+    shard_connection.query(f"INSERT INTO monitored_trip ({_COLUMNS}) VALUES ('2024-05-03', 'trip-1', 'line-1', '1', 'stop-a', NULL, 0, 0, 0)")
+
+    # operation days which have been merged completely are removed from the shard
+    ShardMerger(connection).merge(filename, prune=True)
+
+    assert _trips(shard_connection) == [('2024-05-02', 'trip-1', None), ('2024-05-03', 'trip-1', None)]
+    assert len(_trips(connection)) == 4
+
+def test_stop(connection):
+    supervisor = ShardSupervisor('ticktrack.db3', 'config.yaml', 2, connection=connection)
+    supervisor._processes = {i: subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)']) for i in (1, 2)}
+    processes = list(supervisor._processes.values())
+
+    # the signal is forwarded to all shards, which are waited for
+    supervisor.stop(signal.SIGTERM)
+
+    assert [p.returncode for p in processes] == [-signal.SIGTERM, -signal.SIGTERM]
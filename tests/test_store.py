@@ -0,0 +1,73 @@
+from ticktrack.parser import StopEventRecord
+from ticktrack.store import TripStore
+
+def _record(trip_id: str, realtime: bool = False) -> StopEventRecord:
+    return StopEventRecord(
+        operation_day='2024-05-01',
+        trip_id=trip_id,
+        line_id='line-1',
+        line_name='1',
+        origin_stop_id='stop-a',
+        origin_name='A',
+        destination_stop_id='stop-b',
+        destination_name='B',
+        start_time='2024-05-01T10:00:00+00:00',
+        end_time='2024-05-01T10:30:00+00:00',
+        departure_time='2024-05-01T10:10:00+00:00',
+        realtime=realtime,
+        cancelled=0,
+        num_cancelled_stops=0,
+        num_added_stops=0
+    )
+
+def _trips(connection) -> list:
+    return connection.queryAll('SELECT trip_id, realtime_ref_station, realtime_first_appeared FROM monitored_trip ORDER BY trip_id')
+
+def test_flush(connection):
+    store = TripStore(connection)
+
+    store.observe('station-1', [_record('trip-1'), _record('trip-2')], '2024-05-01T10:00:00+00:00')
+    assert store.flush() == (2, 0)
+
+    store.observe('station-1', [_record('trip-1', True)], '2024-05-01T10:01:00+00:00')
+    assert store.flush() == (0, 1)
+
+    assert _trips(connection) == [
+        ('trip-1', 'station-1', '2024-05-01T10:01:00+00:00'),
+        ('trip-2', 'station-1', None)
+    ]
+
+def test_flush_existing_trip(connection):
+    store = TripStore(connection)
+    store.observe('station-1', [_record('trip-1'), _record('trip-2')], '2024-05-01T10:00:00+00:00')
+
+    # another writer inserts one of the trips before the flush
+    connection.query(
+        "INSERT INTO monitored_trip (operation_day, trip_id, realtime_ref_station, realtime_cancelled, realtime_num_cancelled_stops, realtime_num_added_stops) " \
+        "VALUES ('2024-05-01', 'trip-1', 'station-2', 0, 0, 0)"
+    )
+
+    # the other trip is written nevertheless and nothing is kept pending
+    assert store.flush() == (1, 0)
+    assert store.flush() == (0, 0)
+
+    # the existing trip is loaded again and updated when it's seen the next time
+    store.observe('station-1', [_record('trip-1', True), _record('trip-2')], '2024-05-01T10:01:00+00:00')
+    assert store.flush() == (0, 1)
+
+    assert _trips(connection) == [
+        ('trip-1', 'station-2', '2024-05-01T10:01:00+00:00'),
+        ('trip-2', 'station-1', None)
+    ]
+
+def test_flush_invalid_trip(compact_connection):
+    store = TripStore(compact_connection)
+
+    # the compact layout rejects timestamps which can't be converted, the trip is not written again
+    store.observe('station-1', [_record('trip-1')._replace(start_time='invalid'), _record('trip-2')], '2024-05-01T10:00:00+00:00')
+    assert store.flush() == (1, 0)
+
+    store.observe('station-1', [_record('trip-1')._replace(start_time='invalid')], '2024-05-01T10:01:00+00:00')
+    assert store.flush() == (0, 0)
+
+    assert [r[0] for r in _trips(compact_connection)] == ['trip-2']
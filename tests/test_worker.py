@@ -0,0 +1,67 @@
+import pytest
+
+from ticktrack.store import TripStore
+from ticktrack.window import ResultWindow
+from ticktrack.worker import MonitorWorker
+
+_HEADER = b'<?xml version="1.0" encoding="UTF-8"?>' \
+    b'<Trias xmlns="http://www.vdv.de/trias" xmlns:siri="http://www.siri.org.uk/siri" version="1.1">' \
+    b'<ServiceDelivery><siri:ResponseTimestamp>2024-05-01T10:00:00Z</siri:ResponseTimestamp>'
+
+_RESULT = b'<StopEventResult><ResultId>ID1</ResultId><StopEvent>' \
+    b'<ThisCall><CallAtStop><StopPointRef>stop-a</StopPointRef><StopSeqNumber>1</StopSeqNumber>' \
+    b'<ServiceDeparture><TimetabledTime>2024-05-01T10:10:00Z</TimetabledTime></ServiceDeparture></CallAtStop></ThisCall>' \
+    b'<Service><OperatingDayRef>2024-05-01</OperatingDayRef><JourneyRef>trip-1</JourneyRef><LineRef>line-1</LineRef></Service>' \
+    b'</StopEvent></StopEventResult>'
+
+_RESPONSES = {
+    'results': _HEADER + b'<siri:Status>true</siri:Status><DeliveryPayload><StopEventResponse>' + _RESULT + b'</StopEventResponse></DeliveryPayload></ServiceDelivery></Trias>',
+    'empty': _HEADER + b'<siri:Status>true</siri:Status><DeliveryPayload><StopEventResponse></StopEventResponse></DeliveryPayload></ServiceDelivery></Trias>',
+    'error_message': _HEADER + b'<siri:Status>true</siri:Status><DeliveryPayload><StopEventResponse>' \
+        b'<ErrorMessage><Code>-4030</Code><Text><Text>STOPEVENT_LOCATIONUNSERVED</Text></Text></ErrorMessage>' \
+        b'</StopEventResponse></DeliveryPayload></ServiceDelivery></Trias>',
+    'status_false': _HEADER + b'<siri:Status>false</siri:Status></ServiceDelivery></Trias>',
+    'no_stop_event_response': _HEADER + b'<siri:Status>true</siri:Status><DeliveryPayload></DeliveryPayload></ServiceDelivery></Trias>'
+}
+
+class FakeClient:
+    endpoint = 'http://localhost/trias'
+    headers = dict()
+
+    def __init__(self, response: bytes) -> None:
+        self.response = response
+
+    def post(self, data: bytes) -> bytes:
+        return self.response
+
+def _worker(connection, response: bytes, incremental: bool) -> MonitorWorker:
+    window = ResultWindow(3600, default=20, min_results=1)
+    return MonitorWorker(FakeClient(response), 'key', None, TripStore(connection), window, incremental=incremental)
+
+@pytest.mark.parametrize('incremental', [False, True])
+@pytest.mark.parametrize('response', ['error_message', 'status_false', 'no_stop_event_response'])
+def test_error_response(connection, response, incremental):
+    worker = _worker(connection, _RESPONSES[response], incremental)
+
+    # errors are requested again with the default interval and don't shrink the result window
+    records = worker.fetch('station-1')
+    assert records is None
+    assert worker.process('station-1', records) is None
+    assert worker._window.estimate('station-1') is None
+
+@pytest.mark.parametrize('incremental', [False, True])
+def test_empty_response(connection, incremental):
+    worker = _worker(connection, _RESPONSES['empty'], incremental)
+
+    records = worker.fetch('station-1')
+    assert records == []
+    assert worker.process('station-1', records, timestamp='2024-05-01T10:00:00+00:00') == []
+    assert worker._window.estimate('station-1') == 1
+
+@pytest.mark.parametrize('incremental', [False, True])
+def test_response(connection, incremental):
+    worker = _worker(connection, _RESPONSES['results'], incremental)
+
+    records = worker.fetch('station-1')
+    assert [r.trip_id for r in records] == ['trip-1']
+    assert len(worker.process('station-1', records, timestamp='2024-05-01T10:00:00+00:00')) == 1